@@ -4,138 +4,213 @@ All settings and environment variables
 """
 
 import os
-from dotenv import load_dotenv
+import functools
+from dataclasses import dataclass
+from typing import Mapping, Tuple
 
-# Load environment variables from .env file
-load_dotenv()
 
+def _as_bool(value: str) -> bool:
+    """Parse a True/False environment value"""
+    return value.lower() == "true"
 
+
+@dataclass(frozen=True, slots=True)
 class Config:
-    """Bot configuration class"""
+    """Bot configuration, parsed once from the environment"""
     
     # ==================== Telegram Configuration ====================
-    
-    # Get these from https://my.telegram.org
-    API_ID = int(os.environ.get("API_ID", "0"))
-    API_HASH = os.environ.get("API_HASH", "")
-    
-    # Get from @BotFather on Telegram
-    BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
-    
-    # Your Telegram User ID (for admin commands)
-    # Get it from @userinfobot
-    ADMIN_IDS = [int(x) for x in os.environ.get("ADMIN_IDS", "0").split(",")]
+    API_ID: int
+    API_HASH: str
+    BOT_TOKEN: str
+    ADMIN_IDS: Tuple[int, ...]
+    SESSION_IN_MEMORY: bool
     
     # ==================== Channel Configuration ====================
-    
-    # Index Channel - Where anime info and links will be posted
-    # Format: -1001234567890 (include the -100 prefix)
-    INDEX_CHANNEL_ID = int(os.environ.get("INDEX_CHANNEL_ID", "0"))
-    INDEX_CHANNEL_USERNAME = os.environ.get("INDEX_CHANNEL_USERNAME", "")
-    
-    # Uploads Channel - Where actual video files will be uploaded
-    UPLOADS_CHANNEL_ID = int(os.environ.get("UPLOADS_CHANNEL_ID", "0"))
-    UPLOADS_CHANNEL_USERNAME = os.environ.get("UPLOADS_CHANNEL_USERNAME", "")
-    
-    # Channel Title (appears on thumbnails)
-    CHANNEL_TITLE = os.environ.get("CHANNEL_TITLE", "AutoAnimeBot")
-    
-    # Comments Group Link (linked to index channel)
-    COMMENTS_GROUP_LINK = os.environ.get("COMMENTS_GROUP_LINK", "")
-    
-    # Status Message ID (in uploads channel)
-    # Create a message in your uploads channel and get its ID
-    STATUS_MSG_ID = int(os.environ.get("STATUS_MSG_ID", "0"))
-    
-    # Schedule Message ID (in uploads channel)
-    SCHEDULE_MSG_ID = int(os.environ.get("SCHEDULE_MSG_ID", "0"))
+    INDEX_CHANNEL_ID: int
+    INDEX_CHANNEL_USERNAME: str
+    UPLOADS_CHANNEL_ID: int
+    UPLOADS_CHANNEL_USERNAME: str
+    CHANNEL_TITLE: str
+    COMMENTS_GROUP_LINK: str
+    STATUS_MSG_ID: int
+    SCHEDULE_MSG_ID: int
     
     # ==================== Database Configuration ====================
-    
-    # MongoDB URI - Get free database from https://cloud.mongodb.com
-    MONGO_URI = os.environ.get("MONGO_URI", "")
-    DATABASE_NAME = os.environ.get("DATABASE_NAME", "autoanimebot")
+    MONGO_URI: str
+    DATABASE_NAME: str
     
     # ==================== API Configuration ====================
-    
-    # Consumet API - Self-hosted or use public instance
-    # Deploy your own: https://github.com/consumet/api.consumet.org
-    CONSUMET_API = os.environ.get("CONSUMET_API", "https://api.consumet.org")
-    
-    # AniList API (no key needed)
-    ANILIST_API = "https://graphql.anilist.co"
+    CONSUMET_API: str
+    ANILIST_API: str
     
     # ==================== Download Configuration ====================
-    
-    # Download directory
-    DOWNLOAD_DIR = os.environ.get("DOWNLOAD_DIR", "./downloads")
-    
-    # Qualities to download (360p, 480p, 720p, 1080p)
-    DOWNLOAD_QUALITIES = os.environ.get("DOWNLOAD_QUALITIES", "360p,480p,720p,1080p").split(",")
-    
-    # Maximum file size (in MB) - Telegram limit is 2000MB for bots
-    MAX_FILE_SIZE = int(os.environ.get("MAX_FILE_SIZE", "2000"))
-    
-    # Download timeout (in seconds) - Cancel download after this time
-    DOWNLOAD_TIMEOUT = int(os.environ.get("DOWNLOAD_TIMEOUT", "3600"))  # 1 hour
-    
-    # Sleep time between uploads (in seconds) - To avoid flood limits
-    UPLOAD_SLEEP_TIME = int(os.environ.get("UPLOAD_SLEEP_TIME", "5"))
-    
-    # Maximum retries for failed downloads
-    MAX_RETRIES = int(os.environ.get("MAX_RETRIES", "3"))
+    DOWNLOAD_DIR: str
+    DOWNLOAD_QUALITIES: Tuple[str, ...]
+    MAX_FILE_SIZE: int
+    MAX_FILE_SIZE_BYTES: int
+    DOWNLOAD_TIMEOUT: int
+    UPLOAD_SLEEP_TIME: int
+    UPLOAD_CONCURRENCY: int
+    MAX_RETRIES: int
+    DOWNLOAD_CONCURRENCY: int
     
     # ==================== Scheduler Configuration ====================
-    
-    # Check interval (in seconds)
-    CHECK_INTERVAL = int(os.environ.get("CHECK_INTERVAL", "300"))  # 5 minutes
-    
-    # Update status interval (in seconds)
-    STATUS_UPDATE_INTERVAL = int(os.environ.get("STATUS_UPDATE_INTERVAL", "300"))  # 5 minutes
+    CHECK_INTERVAL: int
+    FULL_CHECK_INTERVAL: int
+    AIRING_CHECK_DELAY: int
+    CHECK_CONCURRENCY: int
+    ANILIST_RATE_LIMIT: int
+    STATUS_UPDATE_INTERVAL: int
     
     # ==================== Advanced Settings ====================
+    ENABLE_THUMBNAILS: bool
+    AUTO_DETECT: bool
+    ENABLE_VOTING: bool
+    DELETE_AFTER_UPLOAD: bool
+    LOG_LEVEL: str
     
-    # Enable thumbnail generation
-    ENABLE_THUMBNAILS = os.environ.get("ENABLE_THUMBNAILS", "True").lower() == "true"
-    
-    # Enable auto episode detection
-    AUTO_DETECT = os.environ.get("AUTO_DETECT", "True").lower() == "true"
-    
-    # Enable voting buttons on index channel
-    ENABLE_VOTING = os.environ.get("ENABLE_VOTING", "True").lower() == "true"
-    
-    # Delete files after upload
-    DELETE_AFTER_UPLOAD = os.environ.get("DELETE_AFTER_UPLOAD", "True").lower() == "true"
-    
-    # Log level (DEBUG, INFO, WARNING, ERROR)
-    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    @classmethod
+    def from_env(cls, env: Mapping[str, str]) -> "Config":
+        """Build configuration from a snapshot of environment variables"""
+        # Maximum file size (in MB) - Telegram limit is 2000MB for bots
+        max_file_size = int(env.get("MAX_FILE_SIZE", "2000"))
+        
+        # Qualities to download (360p, 480p, 720p, 1080p)
+        download_qualities = tuple(env.get("DOWNLOAD_QUALITIES", "360p,480p,720p,1080p").split(","))
+        
+        return cls(
+            # Get these from https://my.telegram.org
+            API_ID=int(env.get("API_ID", "0")),
+            API_HASH=env.get("API_HASH", ""),
+            
+            # Get from @BotFather on Telegram
+            BOT_TOKEN=env.get("BOT_TOKEN", ""),
+            
+            # Your Telegram User ID (for admin commands)
+            # Get it from @userinfobot
+            ADMIN_IDS=tuple(int(x) for x in env.get("ADMIN_IDS", "0").split(",")),
+            
+            # Keep the Pyrogram session in memory instead of AutoAnimeBot.session
+            # (the bot logs in again with BOT_TOKEN on every start)
+            SESSION_IN_MEMORY=_as_bool(env.get("SESSION_IN_MEMORY", "False")),
+            
+            # Index Channel - Where anime info and links will be posted
+            # Format: -1001234567890 (include the -100 prefix)
+            INDEX_CHANNEL_ID=int(env.get("INDEX_CHANNEL_ID", "0")),
+            INDEX_CHANNEL_USERNAME=env.get("INDEX_CHANNEL_USERNAME", ""),
+            
+            # Uploads Channel - Where actual video files will be uploaded
+            UPLOADS_CHANNEL_ID=int(env.get("UPLOADS_CHANNEL_ID", "0")),
+            UPLOADS_CHANNEL_USERNAME=env.get("UPLOADS_CHANNEL_USERNAME", ""),
+            
+            # Channel Title (appears on thumbnails)
+            CHANNEL_TITLE=env.get("CHANNEL_TITLE", "AutoAnimeBot"),
+            
+            # Comments Group Link (linked to index channel)
+            COMMENTS_GROUP_LINK=env.get("COMMENTS_GROUP_LINK", ""),
+            
+            # Status Message ID (in uploads channel)
+            # Create a message in your uploads channel and get its ID
+            STATUS_MSG_ID=int(env.get("STATUS_MSG_ID", "0")),
+            
+            # Schedule Message ID (in uploads channel)
+            SCHEDULE_MSG_ID=int(env.get("SCHEDULE_MSG_ID", "0")),
+            
+            # MongoDB URI - Get free database from https://cloud.mongodb.com
+            MONGO_URI=env.get("MONGO_URI", ""),
+            DATABASE_NAME=env.get("DATABASE_NAME", "autoanimebot"),
+            
+            # Consumet API - Self-hosted or use public instance
+            # Deploy your own: https://github.com/consumet/api.consumet.org
+            CONSUMET_API=env.get("CONSUMET_API", "https://api.consumet.org"),
+            
+            # AniList API (no key needed)
+            ANILIST_API="https://graphql.anilist.co",
+            
+            # Download directory
+            DOWNLOAD_DIR=env.get("DOWNLOAD_DIR", "./downloads"),
+            
+            DOWNLOAD_QUALITIES=download_qualities,
+            
+            MAX_FILE_SIZE=max_file_size,
+            MAX_FILE_SIZE_BYTES=max_file_size * 1024 * 1024,
+            
+            # Download timeout (in seconds) - Cancel download after this time
+            DOWNLOAD_TIMEOUT=int(env.get("DOWNLOAD_TIMEOUT", "3600")),  # 1 hour
+            
+            # Sleep time between uploads (in seconds) - To avoid flood limits
+            UPLOAD_SLEEP_TIME=int(env.get("UPLOAD_SLEEP_TIME", "5")),
+            
+            # Qualities uploaded at the same time (keep low to avoid flood limits)
+            UPLOAD_CONCURRENCY=int(env.get("UPLOAD_CONCURRENCY", "2")),
+            
+            # Maximum retries for failed downloads
+            MAX_RETRIES=int(env.get("MAX_RETRIES", "3")),
+            
+            # Qualities downloaded at the same time (defaults to all of them)
+            DOWNLOAD_CONCURRENCY=int(env.get("DOWNLOAD_CONCURRENCY", str(len(download_qualities)))),
+            
+            # Check interval (in seconds)
+            # Used to re-check aired episodes that sources don't list yet
+            CHECK_INTERVAL=int(env.get("CHECK_INTERVAL", "300")),  # 5 minutes
+            
+            # Full check of every tracked anime (new episodes are otherwise
+            # checked right after they air)
+            FULL_CHECK_INTERVAL=int(env.get("FULL_CHECK_INTERVAL", "21600")),  # 6 hours
+            
+            # Wait after an episode's airing time before looking for it
+            AIRING_CHECK_DELAY=int(env.get("AIRING_CHECK_DELAY", "300")),  # 5 minutes
+            
+            # Number of anime checked at the same time
+            CHECK_CONCURRENCY=int(env.get("CHECK_CONCURRENCY", "8")),
+            
+            # AniList requests allowed per minute
+            ANILIST_RATE_LIMIT=int(env.get("ANILIST_RATE_LIMIT", "30")),
+            
+            # Update status interval (in seconds)
+            STATUS_UPDATE_INTERVAL=int(env.get("STATUS_UPDATE_INTERVAL", "300")),  # 5 minutes
+            
+            # Enable thumbnail generation
+            ENABLE_THUMBNAILS=_as_bool(env.get("ENABLE_THUMBNAILS", "True")),
+            
+            # Enable auto episode detection
+            AUTO_DETECT=_as_bool(env.get("AUTO_DETECT", "True")),
+            
+            # Enable voting buttons on index channel
+            ENABLE_VOTING=_as_bool(env.get("ENABLE_VOTING", "True")),
+            
+            # Delete files after upload
+            DELETE_AFTER_UPLOAD=_as_bool(env.get("DELETE_AFTER_UPLOAD", "True")),
+            
+            # Log level (DEBUG, INFO, WARNING, ERROR)
+            LOG_LEVEL=env.get("LOG_LEVEL", "INFO"),
+        )
     
     # ==================== Validation ====================
     
-    @classmethod
-    def validate(cls):
+    def validate(self):
         """Validate that all required settings are configured"""
         errors = []
         
-        if cls.API_ID == 0:
+        if self.API_ID == 0:
             errors.append("API_ID is not set")
         
-        if not cls.API_HASH:
+        if not self.API_HASH:
             errors.append("API_HASH is not set")
         
-        if not cls.BOT_TOKEN:
+        if not self.BOT_TOKEN:
             errors.append("BOT_TOKEN is not set")
         
-        if not cls.MONGO_URI:
+        if not self.MONGO_URI:
             errors.append("MONGO_URI is not set")
         
-        if cls.INDEX_CHANNEL_ID == 0:
+        if self.INDEX_CHANNEL_ID == 0:
             errors.append("INDEX_CHANNEL_ID is not set")
         
-        if cls.UPLOADS_CHANNEL_ID == 0:
+        if self.UPLOADS_CHANNEL_ID == 0:
             errors.append("UPLOADS_CHANNEL_ID is not set")
         
-        if cls.STATUS_MSG_ID == 0:
+        if self.STATUS_MSG_ID == 0:
             errors.append("STATUS_MSG_ID is not set (create a message in uploads channel first)")
         
         if errors:
@@ -144,30 +219,41 @@ class Config:
         
         return True
     
-    @classmethod
-    def display_config(cls):
+    def display_config(self):
         """Display current configuration (hide sensitive data)"""
         print("\n" + "="*50)
         print("AutoAnimeBot Configuration")
         print("="*50)
-        print(f"API_ID: {cls.API_ID}")
+        print(f"API_ID: {self.API_ID}")
         print(f"API_HASH: {'*' * 10}")
         print(f"BOT_TOKEN: {'*' * 10}")
-        print(f"Index Channel: {cls.INDEX_CHANNEL_ID}")
-        print(f"Uploads Channel: {cls.UPLOADS_CHANNEL_ID}")
-        print(f"Channel Title: {cls.CHANNEL_TITLE}")
-        print(f"Download Qualities: {', '.join(cls.DOWNLOAD_QUALITIES)}")
-        print(f"Max File Size: {cls.MAX_FILE_SIZE} MB")
-        print(f"Check Interval: {cls.CHECK_INTERVAL} seconds")
-        print(f"Thumbnails: {'Enabled' if cls.ENABLE_THUMBNAILS else 'Disabled'}")
-        print(f"Auto Detect: {'Enabled' if cls.AUTO_DETECT else 'Disabled'}")
+        print(f"Index Channel: {self.INDEX_CHANNEL_ID}")
+        print(f"Uploads Channel: {self.UPLOADS_CHANNEL_ID}")
+        print(f"Channel Title: {self.CHANNEL_TITLE}")
+        print(f"Download Qualities: {', '.join(self.DOWNLOAD_QUALITIES)}")
+        print(f"Max File Size: {self.MAX_FILE_SIZE} MB")
+        print(f"Check Interval: {self.CHECK_INTERVAL} seconds")
+        print(f"Thumbnails: {'Enabled' if self.ENABLE_THUMBNAILS else 'Disabled'}")
+        print(f"Auto Detect: {'Enabled' if self.AUTO_DETECT else 'Disabled'}")
         print("="*50 + "\n")
 
 
-# Validate configuration on import
-if __name__ != "__main__":
+@functools.lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Load .env once and return the shared configuration"""
+    # Production containers get real env vars - skip reading a .env file
+    if os.environ.get("RUNTIME_ENV") != "prod":
+        from dotenv import load_dotenv
+        load_dotenv()
+    return Config.from_env(dict(os.environ))
+
+
+# Run `python config.py` to check your settings without starting the bot
+if __name__ == "__main__":
+    config = get_config()
+    config.display_config()
     try:
-        Config.validate()
+        config.validate()
         print("✅ Configuration validated successfully!")
     except ValueError as e:
         print(f"❌ Configuration Error:\n{e}")
@@ -4,19 +4,38 @@ Uses MongoDB (Motor - async driver)
 """
 
 import logging
-from datetime import datetime
-from typing import Dict, List, Optional
-from motor.motor_asyncio import AsyncIOMotorClient
-from config import Config
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+from config import get_config
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient
 
 logger = logging.getLogger(__name__)
 
+# Queue statuses tracked in the counters collection
+QUEUE_STATUSES = ("pending", "downloading", "uploading", "completed", "failed")
+QUEUE_COUNTERS_ID = "queue_counts"
+
+# Anime fields needed by the checker and /list
+ANIME_LIST_PROJECTION = {
+    "_id": 0,
+    "anime_id": 1,
+    "title": 1,
+    "latest_episode": 1,
+    "total_episodes": 1,
+    "active": 1
+}
+
+# Episode lookup index - existence checks are answered from the index alone
+EPISODE_INDEX = [("anime_id", 1), ("episode_number", 1)]
+
 
 class Database:
     """MongoDB database handler"""
     
     def __init__(self):
-        self.client: Optional[AsyncIOMotorClient] = None
+        self.client: Optional["AsyncIOMotorClient"] = None
         self.db = None
         
         # Collections
@@ -24,23 +43,56 @@ class Database:
         self.episodes_collection = None
         self.queue_collection = None
         self.stats_collection = None
+        self.counters_collection = None
     
     async def connect(self):
-        """Connect to MongoDB"""
+        """Connect to MongoDB and warm the connection pool"""
+        if self.client is not None:
+            return True
+        
+        # Imported here so importing this module doesn't pull in motor/pymongo
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from pymongo import WriteConcern
+        
+        config = get_config()
         try:
-            self.client = AsyncIOMotorClient(Config.MONGO_URI)
-            self.db = self.client[Config.DATABASE_NAME]
+            client = AsyncIOMotorClient(
+                config.MONGO_URI,
+                minPoolSize=10,
+                maxPoolSize=50,
+                serverSelectionTimeoutMS=5000,
+                appname="autoanimebot"
+            )
+            # Force server selection so pooled sockets are opened up front
+            await client.admin.command("ping")
+            self.client = client
+            self.db = self.client[config.DATABASE_NAME]
             
             # Initialize collections
             self.anime_collection = self.db["anime"]
             self.episodes_collection = self.db["episodes"]
             self.queue_collection = self.db["queue"]
-            self.stats_collection = self.db["stats"]
+            # Stats are soft counters - fire-and-forget writes skip the ack round-trip
+            self.stats_collection = self.db["stats"].with_options(
+                write_concern=WriteConcern(w=0)
+            )
+            self.counters_collection = self.db["counters"]
             
             # Create indexes
             await self.anime_collection.create_index("anime_id", unique=True)
-            await self.episodes_collection.create_index([("anime_id", 1), ("episode_number", 1)])
+            await self.episodes_collection.create_index(EPISODE_INDEX)
             await self.queue_collection.create_index("status")
+            await self.queue_collection.create_index(
+                [("anime_id", 1), ("episode_number", 1)],
+                unique=True
+            )
+            # Supports get_next_in_queue without an in-memory sort
+            await self.queue_collection.create_index(
+                [("status", 1), ("priority", -1), ("added_at", 1)],
+                name="queue_dequeue"
+            )
+            
+            await self._seed_queue_counters()
             
             logger.info("Database connected successfully")
             return True
@@ -53,6 +105,7 @@ class Database:
         """Close database connection"""
         if self.client:
             self.client.close()
+            self.client = None
             logger.info("Database connection closed")
     
     # ==================== Anime Operations ====================
@@ -60,6 +113,7 @@ class Database:
     async def add_anime(self, anime_data: Dict) -> bool:
         """Add anime to tracking list"""
         try:
+            now = datetime.now(timezone.utc)
             anime_doc = {
                 "anime_id": anime_data["id"],
                 "title": anime_data["title"],
@@ -70,8 +124,8 @@ class Database:
                 "cover_image": anime_data.get("cover_image", ""),
                 "latest_episode": 0,
                 "active": True,
-                "added_at": datetime.utcnow(),
-                "last_checked": datetime.utcnow()
+                "added_at": now,
+                "last_checked": now
             }
             
             result = await self.anime_collection.insert_one(anime_doc)
@@ -98,23 +152,25 @@ class Database:
         """Get list of tracked anime"""
         try:
             query = {"active": True} if active_only else {}
-            cursor = self.anime_collection.find(query)
-            anime_list = await cursor.to_list(length=100)
+            cursor = self.anime_collection.find(query, ANIME_LIST_PROJECTION)
+            anime_list = await cursor.to_list(length=None)
             return anime_list
         except Exception as e:
             logger.error(f"Error getting tracked anime: {e}")
             return []
     
+    async def get_anime(self, anime_id: int) -> Optional[Dict]:
+        """Get a single tracked anime (None if not tracked; raises if the lookup fails)"""
+        return await self.anime_collection.find_one({"anime_id": anime_id}, ANIME_LIST_PROJECTION)
+    
     async def update_anime_episode(self, anime_id: int, episode_number: int):
         """Update latest episode for anime"""
         try:
             await self.anime_collection.update_one(
                 {"anime_id": anime_id},
                 {
-                    "$set": {
-                        "latest_episode": episode_number,
-                        "last_checked": datetime.utcnow()
-                    }
+                    "$set": {"latest_episode": episode_number},
+                    "$currentDate": {"last_checked": True}
                 }
             )
             logger.info(f"Updated anime {anime_id} to episode {episode_number}")
@@ -123,21 +179,25 @@ class Database:
     
     # ==================== Episode Operations ====================
     
+    def _episode_doc(self, episode_data: Dict, added_at: datetime) -> Dict:
+        """Build an episode document"""
+        return {
+            "anime_id": episode_data["anime_id"],
+            "anime_title": episode_data["anime_title"],
+            "episode_number": episode_data["episode_number"],
+            "title": episode_data.get("title", f"Episode {episode_data['episode_number']}"),
+            "download_links": episode_data.get("download_links", {}),
+            "aired_at": episode_data.get("aired_at"),
+            "added_at": added_at,
+            "status": "pending",  # pending, downloaded, uploaded, failed
+            "uploaded_files": {},
+            "retries": 0
+        }
+    
     async def add_episode(self, episode_data: Dict) -> bool:
         """Add episode to database"""
         try:
-            episode_doc = {
-                "anime_id": episode_data["anime_id"],
-                "anime_title": episode_data["anime_title"],
-                "episode_number": episode_data["episode_number"],
-                "title": episode_data.get("title", f"Episode {episode_data['episode_number']}"),
-                "download_links": episode_data.get("download_links", {}),
-                "aired_at": episode_data.get("aired_at"),
-                "added_at": datetime.utcnow(),
-                "status": "pending",  # pending, downloaded, uploaded, failed
-                "uploaded_files": {},
-                "retries": 0
-            }
+            episode_doc = self._episode_doc(episode_data, datetime.now(timezone.utc))
             
             result = await self.episodes_collection.insert_one(episode_doc)
             return bool(result.inserted_id)
@@ -146,6 +206,23 @@ class Database:
             logger.error(f"Error adding episode: {e}")
             return False
     
+    async def add_episodes_bulk(self, episodes: List[Dict]) -> int:
+        """Add several episodes in one round trip, returns how many were inserted"""
+        if not episodes:
+            return 0
+        
+        try:
+            now = datetime.now(timezone.utc)
+            episode_docs = [self._episode_doc(episode_data, now) for episode_data in episodes]
+            
+            # Unordered so one bad document doesn't stop the rest
+            result = await self.episodes_collection.insert_many(episode_docs, ordered=False)
+            return len(result.inserted_ids)
+            
+        except Exception as e:
+            logger.error(f"Error adding episodes: {e}")
+            return 0
+    
     async def get_episode(self, anime_id: int, episode_number: int) -> Optional[Dict]:
         """Get episode data"""
         try:
@@ -161,15 +238,35 @@ class Database:
     async def episode_exists(self, anime_id: int, episode_number: int) -> bool:
         """Check if episode exists in database"""
         try:
-            count = await self.episodes_collection.count_documents({
-                "anime_id": anime_id,
-                "episode_number": episode_number
-            })
-            return count > 0
+            episode = await self.episodes_collection.find_one(
+                {
+                    "anime_id": anime_id,
+                    "episode_number": episode_number
+                },
+                projection={"_id": 0, "episode_number": 1},
+                hint=EPISODE_INDEX
+            )
+            return episode is not None
         except Exception as e:
             logger.error(f"Error checking episode: {e}")
             return False
     
+    async def bulk_exists(self, anime_id: int, episode_numbers: List[int]) -> Set[int]:
+        """Return the subset of episode numbers already stored for an anime"""
+        try:
+            cursor = self.episodes_collection.find(
+                {
+                    "anime_id": anime_id,
+                    "episode_number": {"$in": list(episode_numbers)}
+                },
+                {"episode_number": 1, "_id": 0},
+                hint=EPISODE_INDEX
+            )
+            return {doc["episode_number"] async for doc in cursor}
+        except Exception as e:
+            logger.error(f"Error checking episodes: {e}")
+            return set()
+    
     # ==================== Queue Operations ====================
     
     async def add_to_queue(self, episode_data: Dict) -> bool:
@@ -182,28 +279,35 @@ class Database:
                 "download_links": episode_data.get("download_links", {}),
                 "status": "pending",  # pending, downloading, uploading, completed, failed
                 "priority": episode_data.get("priority", 0),
-                "added_at": datetime.utcnow(),
+                "added_at": datetime.now(timezone.utc),
                 "started_at": None,
                 "completed_at": None,
                 "retries": 0,
                 "error_message": None
             }
             
-            # Check if already in queue
-            exists = await self.queue_collection.count_documents({
-                "anime_id": episode_data["anime_id"],
-                "episode_number": episode_data["episode_number"]
-            })
+            # Insert only if not already queued (unique index guards races)
+            result = await self.queue_collection.update_one(
+                {
+                    "anime_id": episode_data["anime_id"],
+                    "episode_number": episode_data["episode_number"]
+                },
+                {"$setOnInsert": queue_doc},
+                upsert=True
+            )
             
-            if exists:
+            if result.upserted_id is None:
                 logger.warning(f"Episode already in queue: {episode_data['anime_title']} - {episode_data['episode_number']}")
                 return False
             
-            result = await self.queue_collection.insert_one(queue_doc)
+            await self._move_queue_counter(None, "pending")
             logger.info(f"Added to queue: {episode_data['anime_title']} - Episode {episode_data['episode_number']}")
-            return bool(result.inserted_id)
+            return True
             
         except Exception as e:
+            if "duplicate key" in str(e):
+                logger.warning(f"Episode already in queue: {episode_data['anime_title']} - {episode_data['episode_number']}")
+                return False
             logger.error(f"Error adding to queue: {e}")
             return False
     
@@ -213,13 +317,14 @@ class Database:
             episode = await self.queue_collection.find_one_and_update(
                 {"status": "pending"},
                 {
-                    "$set": {
-                        "status": "downloading",
-                        "started_at": datetime.utcnow()
-                    }
+                    "$set": {"status": "downloading"},
+                    "$currentDate": {"started_at": True}
                 },
-                sort=[("priority", -1), ("added_at", 1)]
+                sort=[("priority", -1), ("added_at", 1)],
+                hint="queue_dequeue"
             )
+            if episode:
+                await self._move_queue_counter("pending", "downloading")
             return episode
         except Exception as e:
             logger.error(f"Error getting next in queue: {e}")
@@ -228,16 +333,20 @@ class Database:
     async def mark_episode_completed(self, episode_id) -> bool:
         """Mark episode as completed"""
         try:
-            result = await self.queue_collection.update_one(
+            previous = await self.queue_collection.find_one_and_update(
                 {"_id": episode_id},
                 {
-                    "$set": {
-                        "status": "completed",
-                        "completed_at": datetime.utcnow()
-                    }
-                }
+                    "$set": {"status": "completed"},
+                    "$currentDate": {"completed_at": True}
+                },
+                projection={"status": 1}
             )
-            return result.modified_count > 0
+            if previous is None:
+                return False
+            
+            if previous.get("status") != "completed":
+                await self._move_queue_counter(previous.get("status"), "completed")
+            return True
         except Exception as e:
             logger.error(f"Error marking episode completed: {e}")
             return False
@@ -245,18 +354,24 @@ class Database:
     async def mark_episode_failed(self, episode_id, error_message: str = None) -> bool:
         """Mark episode as failed"""
         try:
-            result = await self.queue_collection.update_one(
+            previous = await self.queue_collection.find_one_and_update(
                 {"_id": episode_id},
                 {
                     "$set": {
                         "status": "failed",
-                        "error_message": error_message,
-                        "completed_at": datetime.utcnow()
+                        "error_message": error_message
                     },
+                    "$currentDate": {"completed_at": True},
                     "$inc": {"retries": 1}
-                }
+                },
+                projection={"status": 1}
             )
-            return result.modified_count > 0
+            if previous is None:
+                return False
+            
+            if previous.get("status") != "failed":
+                await self._move_queue_counter(previous.get("status"), "failed")
+            return True
         except Exception as e:
             logger.error(f"Error marking episode failed: {e}")
             return False
@@ -264,29 +379,50 @@ class Database:
     async def get_queue_info(self) -> Dict:
         """Get queue statistics"""
         try:
-            pipeline = [
-                {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-            ]
-            cursor = self.queue_collection.aggregate(pipeline)
-            results = await cursor.to_list(length=10)
-            
-            queue_info = {
-                "pending": 0,
-                "downloading": 0,
-                "uploading": 0,
-                "completed": 0,
-                "failed": 0
-            }
-            
-            for item in results:
-                queue_info[item["_id"]] = item["count"]
-            
-            return queue_info
+            counters = await self.counters_collection.find_one({"_id": QUEUE_COUNTERS_ID}) or {}
+            return {status: counters.get(status, 0) for status in QUEUE_STATUSES}
             
         except Exception as e:
             logger.error(f"Error getting queue info: {e}")
             return {}
     
+    async def _move_queue_counter(self, from_status: Optional[str], to_status: str):
+        """Shift one item between queue status counters"""
+        increments = {to_status: 1}
+        if from_status in QUEUE_STATUSES:
+            increments[from_status] = -1
+        
+        try:
+            await self.counters_collection.update_one(
+                {"_id": QUEUE_COUNTERS_ID},
+                {"$inc": increments},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error updating queue counters: {e}")
+    
+    async def _seed_queue_counters(self):
+        """Build queue counters from existing queue documents (first run only)"""
+        if await self.counters_collection.find_one({"_id": QUEUE_COUNTERS_ID}, projection={"_id": 1}):
+            return
+        
+        pipeline = [
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]
+        cursor = self.queue_collection.aggregate(pipeline)
+        results = await cursor.to_list(length=10)
+        
+        counts = {status: 0 for status in QUEUE_STATUSES}
+        for item in results:
+            if item["_id"] in counts:
+                counts[item["_id"]] = item["count"]
+        
+        await self.counters_collection.update_one(
+            {"_id": QUEUE_COUNTERS_ID},
+            {"$setOnInsert": counts},
+            upsert=True
+        )
+    
     # ==================== Statistics Operations ====================
     
     async def increment_stat(self, stat_name: str, value: int = 1):
@@ -296,7 +432,7 @@ class Database:
                 {"_id": "global"},
                 {
                     "$inc": {stat_name: value},
-                    "$set": {"last_updated": datetime.utcnow()}
+                    "$currentDate": {"last_updated": True}
                 },
                 upsert=True
             )
@@ -359,3 +495,7 @@ class Database:
         except Exception as e:
             logger.error(f"Error getting detailed stats: {e}")
             return {}
+
+
+# Shared process-wide handler - import this instead of creating new clients
+db = Database()
@@ -4,108 +4,294 @@ Downloads episodes in multiple qualities with retry logic
 """
 
 import os
+import re
 import logging
 import asyncio
 import aiohttp
 import aiofiles
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional
-from config import Config
+from typing import Dict, List, Optional, Set, Tuple
+from config import get_config
 
 logger = logging.getLogger(__name__)
 
+# Read size for streamed downloads - larger chunks mean fewer awaits per MB
+CHUNK_SIZE = 256 * 1024
+
+# Write buffer for downloaded files
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Log download progress every 10MB
+PROGRESS_LOG_STEP = 10 * 1024 * 1024
+
+# Read ahead this much of a file before uploading it
+PREFETCH_BYTES = 32 * 1024 * 1024
+
+# Display units for file sizes, indexed by (bit_length - 1) // 10
+_SIZE_UNITS = (("B", 0), ("KB", 10), ("MB", 20), ("GB", 30), ("TB", 40))
+
+# Shared HTTP session - one connection pool and DNS cache for every download
+_SESSION: Optional[aiohttp.ClientSession] = None
+
+# Content-Range header of a 206 response: "bytes <start>-<end>/<total or *>"
+_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-\d+/(?:\d+|\*)")
+
+# Anything other than word characters, spaces and dashes is stripped from filenames
+_UNSAFE_CHARS = re.compile(r"[^\w \-]")
+
+
+@lru_cache(maxsize=512)
+def sanitize_title(anime_title: str) -> str:
+    """Make an anime title safe for use in filenames"""
+    return _UNSAFE_CHARS.sub("", anime_title).strip().replace(' ', '_')
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Get or create the shared download session"""
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        _SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=32,
+                limit_per_host=8,
+                ttl_dns_cache=300,
+                keepalive_timeout=75,
+                enable_cleanup_closed=True
+            ),
+            timeout=aiohttp.ClientTimeout(total=get_config().DOWNLOAD_TIMEOUT)
+        )
+    return _SESSION
+
+
+async def close_session():
+    """Close the shared download session"""
+    if _SESSION and not _SESSION.closed:
+        await _SESSION.close()
+
+
+def _fadvise(file_path: Path, advice_name: str, length: int = 0):
+    """Give the kernel a page cache hint for the first `length` bytes of a file, 0 for all (Linux only)"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, length, getattr(os, advice_name))
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logger.debug(f"posix_fadvise failed for {file_path.name}: {e}")
+
+
+def content_range_start(content_range: str) -> Optional[int]:
+    """First byte of a Content-Range header like "bytes 100-199/200" (None if unparseable)"""
+    match = _CONTENT_RANGE.match(content_range)
+    return int(match.group(1)) if match else None
+
+
+def drop_page_cache(file_path: Path):
+    """Hint the kernel to evict a file from page cache"""
+    _fadvise(file_path, "POSIX_FADV_DONTNEED")
+
+
+def prefetch_file(file_path: Path):
+    """Hint the kernel to read the start of a file into page cache ahead of use"""
+    # Only a bounded window - prefetching whole GB-sized files would evict other
+    # pages (and its own early pages) before they're read; normal readahead covers the rest
+    _fadvise(file_path, "POSIX_FADV_WILLNEED", PREFETCH_BYTES)
+
 
 class AnimeDownloader:
     """Handles downloading anime episodes"""
     
     def __init__(self):
-        self.download_dir = Path(Config.DOWNLOAD_DIR)
+        self.download_dir = Path(get_config().DOWNLOAD_DIR)
         self.download_dir.mkdir(parents=True, exist_ok=True)
-        self.session: Optional[aiohttp.ClientSession] = None
+        
+        # Names of complete files on disk, so lookups don't stat per quality
+        self._completed: Set[str] = self._scan_completed()
+    
+    def _scan_completed(self) -> Set[str]:
+        """List finished downloads once at startup"""
+        with os.scandir(self.download_dir) as entries:
+            return {entry.name for entry in entries if entry.name.endswith(".mp4") and entry.is_file()}
     
     async def get_session(self) -> aiohttp.ClientSession:
-        """Get or create aiohttp session"""
-        if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=Config.DOWNLOAD_TIMEOUT)
-            )
-        return self.session
+        """Get the shared aiohttp session"""
+        return await get_session()
     
     async def close_session(self):
-        """Close aiohttp session"""
-        if self.session and not self.session.closed:
-            await self.session.close()
+        """Close the shared aiohttp session"""
+        await close_session()
     
     def get_file_path(self, anime_title: str, episode_number: int, quality: str) -> Path:
         """Generate file path for episode"""
-        # Sanitize anime title for filename
-        safe_title = "".join(c for c in anime_title if c.isalnum() or c in (' ', '-', '_'))
-        safe_title = safe_title.strip().replace(' ', '_')
-        
+        safe_title = sanitize_title(anime_title)
         filename = f"{safe_title}_E{episode_number:03d}_{quality}.mp4"
         return self.download_dir / filename
     
-    async def download_file(self, url: str, file_path: Path, quality: str) -> bool:
-        """Download a single file with progress tracking"""
+    def get_part_path(self, file_path: Path) -> Path:
+        """Path of the in-progress download for a file"""
+        return file_path.with_suffix(file_path.suffix + ".part")
+    
+    async def probe_file_size(self, url: str) -> int:
+        """Get remote file size with a HEAD request (0 if unknown)"""
+        try:
+            session = await self.get_session()
+            async with session.head(url, allow_redirects=True) as response:
+                if response.status != 200:
+                    # e.g. 405 - server doesn't support HEAD, let the GET decide
+                    return 0
+                return int(response.headers.get('content-length', 0))
+        except Exception as e:
+            logger.debug(f"HEAD request failed: {e}")
+            return 0
+    
+    async def download_file(self, url: str, file_path: Path, quality: str) -> int:
+        """Download a single file with progress tracking, resuming partial downloads (returns its size, 0 on failure)"""
+        # Stream into a .part file and rename on success so file_path is never torn
+        tmp_path = self.get_part_path(file_path)
+        
+        # Bind settings once - nothing below re-reads config inside the chunk loop
+        max_bytes = get_config().MAX_FILE_SIZE_BYTES
+        chunk_size = CHUNK_SIZE
+        log_step = PROGRESS_LOG_STEP
+        
         try:
             session = await self.get_session()
             
-            logger.info(f"Downloading {quality}: {file_path.name}")
+            # Continue from where a previous attempt stopped
+            start = tmp_path.stat().st_size if tmp_path.exists() else 0
             
-            async with session.get(url) as response:
-                if response.status != 200:
+            if start:
+                logger.info(f"Resuming {quality} at {start / 1024 / 1024:.1f} MB: {file_path.name}")
+            else:
+                logger.info(f"Downloading {quality}: {file_path.name}")
+            
+            # Reject oversized files before opening the streaming GET
+            total_size = await self.probe_file_size(url)
+            if total_size > max_bytes:
+                logger.warning(f"File too large ({total_size / 1024 / 1024:.1f} MB), skipping {quality}")
+                return 0
+            
+            headers = {"Range": f"bytes={start}-"} if start else None
+            
+            response = await session.get(url, headers=headers)
+            if start and response.status == 416:
+                response.release()
+                
+                # Nothing left to fetch - a previous attempt already got the whole file
+                if start == total_size:
+                    os.replace(tmp_path, file_path)
+                    drop_page_cache(file_path)
+                    logger.info(f"Download completed: {file_path.name} ({start / 1024 / 1024:.1f} MB)")
+                    return start
+                
+                # Partial file doesn't match the remote one - start over right away
+                logger.warning(f"Cannot resume {quality}, restarting download")
+                tmp_path.unlink(missing_ok=True)
+                start = 0
+                response = await session.get(url)
+            
+            async with response:
+                if response.status == 206:
+                    # Appending a different range than requested would silently corrupt the file
+                    range_start = content_range_start(response.headers.get('Content-Range', ''))
+                    if range_start != start:
+                        logger.warning(f"Server returned range starting at {range_start} instead of {start} for {quality}, restarting download")
+                        tmp_path.unlink(missing_ok=True)
+                        return 0
+                    mode = 'ab'
+                elif response.status == 200:
+                    # Server ignored the Range header, rewrite from scratch
+                    start = 0
+                    mode = 'wb'
+                else:
                     logger.error(f"Download failed with status {response.status}")
-                    return False
+                    return 0
                 
-                # Get file size
-                total_size = int(response.headers.get('content-length', 0))
+                # Get file size (content-length only covers the remaining bytes on resume)
+                total_size = start + int(response.headers.get('content-length', 0))
                 
                 # Check if file is too large
-                if total_size > Config.MAX_FILE_SIZE * 1024 * 1024:
+                if total_size > max_bytes:
                     logger.warning(f"File too large ({total_size / 1024 / 1024:.1f} MB), skipping {quality}")
-                    return False
+                    return 0
                 
                 # Download file
-                downloaded = 0
-                async with aiofiles.open(file_path, 'wb') as f:
-                    async for chunk in response.content.iter_chunked(8192):
+                downloaded = start
+                next_log = start + log_step
+                async with aiofiles.open(tmp_path, mode, buffering=WRITE_BUFFER_SIZE) as f:
+                    async for chunk in response.content.iter_chunked(chunk_size):
                         await f.write(chunk)
                         downloaded += len(chunk)
                         
                         # Log progress every 10MB
-                        if downloaded % (10 * 1024 * 1024) == 0:
+                        if downloaded >= next_log:
+                            next_log += log_step
                             progress = (downloaded / total_size * 100) if total_size > 0 else 0
                             logger.info(f"Progress {quality}: {progress:.1f}%")
                 
+                os.replace(tmp_path, file_path)
+                
+                # The file can wait behind buffered episodes before upload - don't let it
+                # evict hotter pages meanwhile (the uploader prefetches its start again)
+                drop_page_cache(file_path)
                 logger.info(f"Download completed: {file_path.name} ({downloaded / 1024 / 1024:.1f} MB)")
-                return True
+                return downloaded
                 
         except asyncio.TimeoutError:
+            # Keep the partial file so the next attempt can resume it
             logger.error(f"Download timeout for {quality}")
-            # Delete partial file
-            if file_path.exists():
-                file_path.unlink()
-            return False
+            return 0
             
         except Exception as e:
+            # Keep the partial file so the next attempt can resume it
             logger.error(f"Download error for {quality}: {e}")
-            # Delete partial file
-            if file_path.exists():
-                file_path.unlink()
-            return False
+            return 0
+    
+    async def _download_quality(self, semaphore: asyncio.Semaphore, anime_title: str, episode_number: int, quality: str, link: str) -> Optional[Tuple[Path, int]]:
+        """Download one quality of an episode with retries"""
+        max_retries = get_config().MAX_RETRIES
+        file_path = self.get_file_path(anime_title, episode_number, quality)
+        
+        # Skip if already downloaded (only complete files ever get this name)
+        if file_path.name in self._completed:
+            logger.info(f"File already exists: {file_path.name}")
+            return file_path, self.get_file_size(file_path)
+        
+        async with semaphore:
+            # Try downloading with retries
+            for attempt in range(max_retries):
+                if attempt > 0:
+                    logger.info(f"Retry {attempt + 1}/{max_retries} for {quality}")
+                    await asyncio.sleep(5)  # Wait before retry
+                
+                file_size = await self.download_file(link, file_path, quality)
+                if file_size:
+                    self._completed.add(file_path.name)
+                    return file_path, file_size
+        
+        logger.error(f"Failed to download {quality} after {max_retries} attempts")
+        # Give up on the partial file as well
+        self.get_part_path(file_path).unlink(missing_ok=True)
+        return None
     
-    async def download_episode(self, episode_data: Dict) -> Dict[str, Path]:
-        """Download episode in all available qualities"""
+    async def download_episode(self, episode_data: Dict) -> Dict[str, Tuple[Path, int]]:
+        """Download episode in all available qualities concurrently (quality -> (path, size))"""
         anime_title = episode_data["anime_title"]
         episode_number = episode_data["episode_number"]
         download_links = episode_data.get("download_links", {})
+        config = get_config()
+        qualities = config.DOWNLOAD_QUALITIES
         
         logger.info(f"Starting download: {anime_title} - Episode {episode_number}")
         
-        downloaded_files = {}
+        semaphore = asyncio.Semaphore(config.DOWNLOAD_CONCURRENCY)
+        jobs = {}
         
-        # Download each quality
-        for quality in Config.DOWNLOAD_QUALITIES:
+        for quality in qualities:
             # Check if link exists for this quality
             link = download_links.get(quality)
             
@@ -113,29 +299,16 @@ class AnimeDownloader:
                 logger.warning(f"No {quality} link available for {anime_title} E{episode_number}")
                 continue
             
-            file_path = self.get_file_path(anime_title, episode_number, quality)
-            
-            # Skip if already downloaded
-            if file_path.exists():
-                logger.info(f"File already exists: {file_path.name}")
-                downloaded_files[quality] = file_path
-                continue
-            
-            # Try downloading with retries
-            success = False
-            for attempt in range(Config.MAX_RETRIES):
-                if attempt > 0:
-                    logger.info(f"Retry {attempt + 1}/{Config.MAX_RETRIES} for {quality}")
-                    await asyncio.sleep(5)  # Wait before retry
-                
-                success = await self.download_file(link, file_path, quality)
-                
-                if success:
-                    downloaded_files[quality] = file_path
-                    break
-            
-            if not success:
-                logger.error(f"Failed to download {quality} after {Config.MAX_RETRIES} attempts")
+            jobs[quality] = self._download_quality(semaphore, anime_title, episode_number, quality, link)
+        
+        results = await asyncio.gather(*jobs.values(), return_exceptions=True)
+        
+        downloaded_files = {}
+        for quality, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.error(f"Download error for {quality}: {result}")
+            elif result:
+                downloaded_files[quality] = result
         
         if not downloaded_files:
             logger.error(f"No files downloaded for {anime_title} E{episode_number}")
@@ -144,8 +317,14 @@ class AnimeDownloader:
         logger.info(f"Download completed: {anime_title} E{episode_number} ({len(downloaded_files)} qualities)")
         return downloaded_files
     
+    def forget_episode(self, downloaded_files: Dict[str, Tuple[Path, int]]):
+        """Drop files deleted elsewhere (e.g. after upload) from the completed set"""
+        for file_path, _ in downloaded_files.values():
+            self._completed.discard(file_path.name)
+    
     def cleanup_file(self, file_path: Path):
         """Delete a downloaded file"""
+        self._completed.discard(file_path.name)
         try:
             if file_path.exists():
                 file_path.unlink()
@@ -153,9 +332,9 @@ class AnimeDownloader:
         except Exception as e:
             logger.error(f"Error deleting file {file_path}: {e}")
     
-    def cleanup_episode(self, downloaded_files: Dict[str, Path]):
+    def cleanup_episode(self, downloaded_files: Dict[str, Tuple[Path, int]]):
         """Delete all files for an episode"""
-        for file_path in downloaded_files.values():
+        for file_path, _ in downloaded_files.values():
             self.cleanup_file(file_path)
     
     def get_file_size(self, file_path: Path) -> int:
@@ -167,11 +346,8 @@ class AnimeDownloader:
     
     def format_file_size(self, size_bytes: int) -> str:
         """Format file size for display"""
-        if size_bytes < 1024:
+        index = min(max(size_bytes.bit_length() - 1, 0) // 10, len(_SIZE_UNITS) - 1)
+        unit, shift = _SIZE_UNITS[index]
+        if not shift:
             return f"{size_bytes} B"
-        elif size_bytes < 1024 * 1024:
-            return f"{size_bytes / 1024:.1f} KB"
-        elif size_bytes < 1024 * 1024 * 1024:
-            return f"{size_bytes / 1024 / 1024:.1f} MB"
-        else:
-            return f"{size_bytes / 1024 / 1024 / 1024:.1f} GB"
+        return f"{size_bytes / (1 << shift):.1f} {unit}"
@@ -4,64 +4,116 @@ Recreated for 2025 with modern tech stack
 """
 
 import asyncio
+import atexit
 import logging
+import logging.handlers
 import os
-import threading
-from flask import Flask # <--- ADD THIS
-from pyrogram import Client, filters, idle
-from pyrogram import Client, filters, idle
+import queue
+import sys
+import time
+from typing import Dict, Optional
+from aiohttp import web
+from pyrogram import Client, enums, filters, idle
+from pyrogram.errors import FloodWait
 from pyrogram.types import Message
-from config import Config
-from database import Database
-from scheduler import AnimeScheduler
+from config import get_config
+from database import db
+from scheduler import Anime, AnimeScheduler
 from downloader import AnimeDownloader
 from uploader import TelegramUploader
 
-# Setup logging
+# Use uvloop's faster event loop when available (not supported on Windows)
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
+# Setup logging - records are queued and written by a background thread,
+# so file and console I/O never blocks the event loop
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.handlers.RotatingFileHandler('bot.log', maxBytes=10_000_000, backupCount=3),
+    logging.StreamHandler()
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+# QueueHandler.prepare() formats each record before queueing it - keep that to the
+# bare message so the listener's handlers apply log_formatter only once
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
+    format="%(message)s",
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
+config = get_config()
 
 # Initialize bot client
 # --- RENDER HEARTBEAT SETUP ---
-webapp = Flask(__name__)
-
-@webapp.route('/')
-def health_check():
-    return "Bot is Running!", 200
-
-def run_web_server():
+async def health_check(request: web.Request) -> web.Response:
+    return web.Response(text="Bot is Running!")
+
+async def start_web_server() -> web.AppRunner:
+    """Serve the health check on the bot's event loop"""
+    runner = web.AppRunner(web.Application())
+    runner.app.router.add_get('/', health_check)
+    await runner.setup()
+    
     # Render provides the port automatically
     port = int(os.environ.get("PORT", 10000))
-    webapp.run(host='0.0.0.0', port=port)
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    return runner
 # ------------------------------
 app = Client(
     name="AutoAnimeBot",
-    api_id=Config.API_ID,
-    api_hash=Config.API_HASH,
-    bot_token=Config.BOT_TOKEN,
-    workers=4
+    api_id=config.API_ID,
+    api_hash=config.API_HASH,
+    bot_token=config.BOT_TOKEN,
+    workers=min(32, (os.cpu_count() or 1) * 4),
+    in_memory=config.SESSION_IN_MEMORY,
+    # Replies only use Markdown - skip the combined Markdown+HTML parser
+    parse_mode=enums.ParseMode.MARKDOWN
 )
 
+
+def tune_session_storage():
+    """Use WAL for the on-disk session so peer lookups don't wait on fsync"""
+    if config.SESSION_IN_MEMORY:
+        return
+    try:
+        conn = app.storage.conn
+        
+        # Startup leaves peer updates uncommitted, and SQLite silently ignores
+        # journal_mode changes inside a transaction
+        conn.commit()
+        
+        journal_mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if journal_mode != "wal":
+            logger.warning(f"Session storage is still in '{journal_mode}' journal mode, WAL not enabled")
+            return
+        conn.execute("PRAGMA synchronous=NORMAL")
+    except Exception as e:
+        logger.warning(f"Could not enable WAL for session storage: {e}")
+
 # Initialize components
-db = Database()
 scheduler = AnimeScheduler(db)
 downloader = AnimeDownloader()
 uploader = TelegramUploader(app, db)
 
+# Downloaded episodes waiting for upload - downloads run ahead by at most this many
+UPLOAD_BUFFER_SIZE = 2
+upload_queue = asyncio.Queue(maxsize=UPLOAD_BUFFER_SIZE)
 
-# ==================== Bot Commands ====================
 
-@app.on_message(filters.command("start") & filters.private)
-async def start_command(client: Client, message: Message):
-    """Welcome message"""
-    welcome_text = f"""
+# ==================== Reply Templates ====================
+
+START_TEMPLATE = """
 👋 **Welcome to AutoAnimeBot!**
 
 I automatically download and upload anime episodes to your channels.
@@ -75,55 +127,100 @@ I automatically download and upload anime episodes to your channels.
 /logs - Get recent logs (Admin only)
 /help - Show help
 
-**Current Status:** {'🟢 Running' if scheduler.is_running else '🔴 Stopped'}
+**Current Status:** {status}
     """
-    await message.reply_text(welcome_text)
-
 
-@app.on_message(filters.command("status"))
-async def status_command(client: Client, message: Message):
-    """Show current bot status"""
-    stats = await db.get_stats()
-    
-    status_text = f"""
+STATUS_TEMPLATE = """
 📊 **Bot Status**
 
 🟢 **System:** Running
 ⏰ **Uptime:** Started
-📺 **Tracked Anime:** {stats.get('tracked_anime', 0)}
-📥 **Total Downloads:** {stats.get('total_downloads', 0)}
-📤 **Total Uploads:** {stats.get('total_uploads', 0)}
-⏳ **Queue:** {stats.get('queue_size', 0)} episodes
+📺 **Tracked Anime:** {tracked_anime}
+📥 **Total Downloads:** {total_downloads}
+📤 **Total Uploads:** {total_uploads}
+⏳ **Queue:** {queue_size} episodes
 
-**Last Check:** {stats.get('last_check', 'Never')}
+**Last Check:** {last_check}
     """
-    
-    await message.reply_text(status_text)
-
-
-@app.on_message(filters.command("stats"))
-async def stats_command(client: Client, message: Message):
-    """Show detailed statistics"""
-    stats = await db.get_detailed_stats()
-    
-    stats_text = f"""
+STATUS_DEFAULTS = {
+    "tracked_anime": 0,
+    "total_downloads": 0,
+    "total_uploads": 0,
+    "queue_size": 0,
+    "last_check": "Never"
+}
+
+STATS_TEMPLATE = """
 📈 **Detailed Statistics**
 
 **Today:**
-• Downloads: {stats.get('today_downloads', 0)}
-• Uploads: {stats.get('today_uploads', 0)}
+• Downloads: {today_downloads}
+• Uploads: {today_uploads}
 
 **This Week:**
-• Downloads: {stats.get('week_downloads', 0)}
-• Uploads: {stats.get('week_uploads', 0)}
+• Downloads: {week_downloads}
+• Uploads: {week_uploads}
 
 **All Time:**
-• Total Episodes: {stats.get('total_episodes', 0)}
-• Total Size: {stats.get('total_size', '0 GB')}
-• Success Rate: {stats.get('success_rate', '0')}%
+• Total Episodes: {total_episodes}
+• Total Size: {total_size}
+• Success Rate: {success_rate}%
     """
-    
-    await message.reply_text(stats_text)
+STATS_DEFAULTS = {
+    "today_downloads": 0,
+    "today_uploads": 0,
+    "week_downloads": 0,
+    "week_uploads": 0,
+    "total_episodes": 0,
+    "total_size": "0 GB",
+    "success_rate": "0"
+}
+
+HELP_TEXT = """
+📚 **Help - AutoAnimeBot**
+
+**User Commands:**
+• /start - Start the bot
+• /status - Check bot status
+• /stats - View statistics
+• /add [name] - Track new anime
+• /list - Show tracked anime
+• /remove [id] - Stop tracking anime
+• /help - Show this message
+
+**How it works:**
+1. Add anime using /add command
+2. Bot automatically checks for new episodes
+3. Downloads episodes in multiple qualities
+4. Uploads to your channels
+5. Posts info and links
+
+**Need more help?**
+Check the documentation or contact admin.
+    """
+
+
+# ==================== Bot Commands ====================
+
+@app.on_message(filters.command("start") & filters.private)
+async def start_command(client: Client, message: Message):
+    """Welcome message"""
+    status = '🟢 Running' if scheduler.is_running else '🔴 Stopped'
+    await message.reply_text(START_TEMPLATE.format(status=status))
+
+
+@app.on_message(filters.command("status"))
+async def status_command(client: Client, message: Message):
+    """Show current bot status"""
+    stats = await db.get_stats()
+    await message.reply_text(STATUS_TEMPLATE.format_map({**STATUS_DEFAULTS, **stats}))
+
+
+@app.on_message(filters.command("stats"))
+async def stats_command(client: Client, message: Message):
+    """Show detailed statistics"""
+    stats = await db.get_detailed_stats()
+    await message.reply_text(STATS_TEMPLATE.format_map({**STATS_DEFAULTS, **stats}))
 
 
 @app.on_message(filters.command("add"))
@@ -146,14 +243,16 @@ async def add_anime_command(client: Client, message: Message):
         
         # Show results (for now, just add the first match)
         anime = results[0]
-        success = await db.add_anime(anime)
+        success = await db.add_anime(anime.as_dict())
         
         if success:
+            scheduler.invalidate_anime_info(anime.id)
+            scheduler.schedule_check(anime.id, time.time())
             await msg.edit_text(
                 f"✅ Added to tracking list!\n\n"
-                f"**Title:** {anime['title']}\n"
-                f"**Episodes:** {anime.get('episodes', 'Unknown')}\n"
-                f"**Status:** {anime.get('status', 'Unknown')}"
+                f"**Title:** {anime.title}\n"
+                f"**Episodes:** {anime.episodes or 'Unknown'}\n"
+                f"**Status:** {anime.status or 'Unknown'}"
             )
         else:
             await msg.edit_text("❌ This anime is already being tracked!")
@@ -204,7 +303,7 @@ async def remove_anime_command(client: Client, message: Message):
         await message.reply_text(f"❌ Error: {str(e)}")
 
 
-@app.on_message(filters.command("logs") & filters.user(Config.ADMIN_IDS))
+@app.on_message(filters.command("logs") & filters.user(list(config.ADMIN_IDS)))
 async def logs_command(client: Client, message: Message):
     """Send recent logs (Admin only)"""
     try:
@@ -221,35 +320,31 @@ async def logs_command(client: Client, message: Message):
 @app.on_message(filters.command("help"))
 async def help_command(client: Client, message: Message):
     """Show help information"""
-    help_text = """
-📚 **Help - AutoAnimeBot**
+    await message.reply_text(HELP_TEXT)
 
-**User Commands:**
-• /start - Start the bot
-• /status - Check bot status
-• /stats - View statistics
-• /add [name] - Track new anime
-• /list - Show tracked anime
-• /remove [id] - Stop tracking anime
-• /help - Show this message
 
-**How it works:**
-1. Add anime using /add command
-2. Bot automatically checks for new episodes
-3. Downloads episodes in multiple qualities
-4. Uploads to your channels
-5. Posts info and links
-
-**Need more help?**
-Check the documentation or contact admin.
-    """
-    await message.reply_text(help_text)
+# ==================== Background Tasks ====================
 
+async def check_anime(anime: Dict, semaphore: asyncio.Semaphore, anime_info: Optional[Anime] = None):
+    """Check a single anime for new episodes and queue them"""
+    async with semaphore:
+        try:
+            # Check for new episodes
+            new_episodes = await scheduler.check_anime_updates(anime, anime_info)
+            
+            if new_episodes:
+                logger.info(f"Found {len(new_episodes)} new episodes for {anime['title']}")
+                
+                for episode in new_episodes:
+                    # Add to download queue
+                    await db.add_to_queue(episode)
+                    
+        except Exception as e:
+            logger.error(f"Error checking {anime.get('title', 'Unknown')}: {e}")
 
-# ==================== Background Tasks ====================
 
 async def check_new_episodes():
-    """Background task to check for new episodes"""
+    """Background task that checks every tracked anime (safety net for the airing dispatcher)"""
     logger.info("Starting episode checker...")
     
     while True:
@@ -259,36 +354,56 @@ async def check_new_episodes():
             # Get list of tracked anime
             anime_list = await db.get_tracked_anime()
             
-            for anime in anime_list:
-                try:
-                    # Check for new episodes
-                    new_episodes = await scheduler.check_anime_updates(anime)
-                    
-                    if new_episodes:
-                        logger.info(f"Found {len(new_episodes)} new episodes for {anime['title']}")
-                        
-                        for episode in new_episodes:
-                            # Add to download queue
-                            await db.add_to_queue(episode)
-                            
-                except Exception as e:
-                    logger.error(f"Error checking {anime.get('title', 'Unknown')}: {e}")
-                    continue
-                
-                # Small delay between anime checks
-                await asyncio.sleep(5)
+            # One AniList request per batch instead of one per anime
+            anime_infos = await scheduler.get_anime_info_bulk([anime["anime_id"] for anime in anime_list])
             
-            # Wait 5 minutes before next check
-            logger.info("Sleeping for 5 minutes...")
-            await asyncio.sleep(300)
+            # Check several anime at once (AniList calls are rate limited in the scheduler)
+            semaphore = asyncio.Semaphore(config.CHECK_CONCURRENCY)
+            await asyncio.gather(
+                *(check_anime(anime, semaphore, anime_infos.get(anime["anime_id"])) for anime in anime_list),
+                return_exceptions=True
+            )
+            
+            # Airing-time checks are handled by airing_dispatcher in between
+            logger.info(f"Next full check in {config.FULL_CHECK_INTERVAL} seconds")
+            await asyncio.sleep(config.FULL_CHECK_INTERVAL)
             
         except Exception as e:
             logger.error(f"Error in episode checker: {e}")
             await asyncio.sleep(60)
 
 
+async def airing_dispatcher():
+    """Background task that checks each anime when its next episode airs"""
+    logger.info("Starting airing dispatcher...")
+    semaphore = asyncio.Semaphore(1)
+    
+    while True:
+        try:
+            anime_id = await scheduler.wait_for_due_check()
+            
+            try:
+                anime = await db.get_anime(anime_id)
+            except Exception as e:
+                # Database hiccup, not an untracked anime - try again later
+                logger.error(f"Error getting anime {anime_id}: {e}")
+                scheduler.schedule_retry(anime_id)
+                continue
+            
+            if not anime or not anime.get("active", True):
+                continue
+            
+            # Airing info changes right after an episode airs - don't use a cached copy
+            scheduler.invalidate_anime_info(anime_id)
+            await check_anime(anime, semaphore)
+            
+        except Exception as e:
+            logger.error(f"Error in airing dispatcher: {e}")
+            await asyncio.sleep(60)
+
+
 async def process_download_queue():
-    """Background task to process download queue"""
+    """Background task that downloads queued episodes and hands them to the uploader"""
     logger.info("Starting download processor...")
     
     while True:
@@ -303,17 +418,11 @@ async def process_download_queue():
                 downloaded_files = await downloader.download_episode(episode)
                 
                 if downloaded_files:
-                    # Upload to Telegram
-                    await uploader.upload_episode(episode, downloaded_files)
-                    
-                    # Mark as completed
-                    await db.mark_episode_completed(episode['_id'])
+                    # Waits here while the uploader is UPLOAD_BUFFER_SIZE episodes behind
+                    await upload_queue.put((episode, downloaded_files))
                 else:
                     # Mark as failed
                     await db.mark_episode_failed(episode['_id'])
-                
-                # Small delay between downloads
-                await asyncio.sleep(10)
             else:
                 # No items in queue, wait a bit
                 await asyncio.sleep(30)
@@ -323,19 +432,40 @@ async def process_download_queue():
             await asyncio.sleep(60)
 
 
+async def process_upload_queue():
+    """Background task that uploads downloaded episodes while the next one downloads"""
+    logger.info("Starting upload processor...")
+    
+    while True:
+        episode, downloaded_files = await upload_queue.get()
+        try:
+            # Upload to Telegram
+            await uploader.upload_episode(episode, downloaded_files)
+            if config.DELETE_AFTER_UPLOAD:
+                downloader.forget_episode(downloaded_files)
+            
+            # Mark as completed
+            await db.mark_episode_completed(episode['_id'])
+            
+        except Exception as e:
+            logger.error(f"Error in upload processor: {e}")
+            await db.mark_episode_failed(episode['_id'])
+        finally:
+            upload_queue.task_done()
+
+
 async def update_status_message():
     """Update status message in channel periodically"""
     logger.info("Starting status updater...")
+    last_status_hash = None
+    failures = 0
     
     while True:
         try:
             stats = await db.get_stats()
             queue = await db.get_queue_info()
             
-            from datetime import datetime
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            status_text = f"""
+            stats_text = f"""
 🤖 **AutoAnimeBot Status**
 
 📊 **Statistics:**
@@ -347,22 +477,39 @@ async def update_status_message():
 • Pending: {queue.get('pending', 0)}
 • Downloading: {queue.get('downloading', 0)}
 • Uploading: {queue.get('uploading', 0)}
-
+"""
+            
+            # Skip the edit when nothing but the timestamp would change
+            status_hash = hash(stats_text)
+            if status_hash != last_status_hash:
+                from datetime import datetime
+                current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                status_text = f"""{stats_text}
 🕐 Last Updated: {current_time}
             """
+                
+                await app.edit_message_text(
+                    chat_id=config.UPLOADS_CHANNEL_ID,
+                    message_id=config.STATUS_MSG_ID,
+                    text=status_text
+                )
+                last_status_hash = status_hash
             
-            await app.edit_message_text(
-                chat_id=Config.UPLOADS_CHANNEL_ID,
-                message_id=Config.STATUS_MSG_ID,
-                text=status_text
-            )
+            failures = 0
             
             # Update every 5 minutes
             await asyncio.sleep(300)
             
+        except FloodWait as e:
+            # Telegram says exactly how long to wait
+            logger.warning(f"Status update flood wait: {e.value} seconds")
+            await asyncio.sleep(e.value + 1)
+            
         except Exception as e:
+            # Back off 2, 4, 8... minutes on repeated failures, up to 15
+            failures += 1
             logger.error(f"Error updating status: {e}")
-            await asyncio.sleep(300)
+            await asyncio.sleep(min(60 * 2 ** failures, 900))
 
 
 # ==================== Main Entry Point ====================
@@ -371,23 +518,36 @@ async def main():
     """Main function"""
     logger.info("Starting AutoAnimeBot...")
     
+    # Validate configuration once at startup (not on import)
     try:
-        # Initialize database
-        # PASTE THIS LINE HERE:
-        threading.Thread(target=run_web_server, daemon=True).start()
+        config.validate()
+        logger.info("Configuration validated successfully!")
+    except ValueError as e:
+        logger.error(f"Configuration Error:\n{e}")
+        logger.error("Please check your .env file and set all required variables.")
+        sys.exit(1)
+    
+    # Without TgCrypto, Pyrogram silently falls back to pure-Python AES
+    try:
+        import tgcrypto  # noqa: F401
+    except ImportError:
+        logger.error("TgCrypto is not installed - run: pip install -r requirements.txt")
+        sys.exit(1)
+    
+    web_runner = None
+    try:
+        # Start the health check server
+        web_runner = await start_web_server()
         
         # Initialize database
         await db.connect()
         logger.info("Database connected")
         
-        # ... rest of your code stays exactly the same ...
-        await db.connect()
-        logger.info("Database connected")
-        
         # Start the bot
         await app.start()
+        tune_session_storage()
         logger.info("Bot started successfully!")
-
+        
         # THIS LINE FIXES THE PEER ID ERROR ONCE LOGIN SUCCEEDS
         try:
             await app.get_chat("zoro_fun11")
@@ -395,26 +555,36 @@ async def main():
         except Exception as e:
             logger.warning(f"Initial sync failed: {e}")
         # ----------------------------------------------------
-
-        # Start background tasks
-        asyncio.create_task(check_new_episodes())
-        
-        # Start background tasks
-        asyncio.create_task(check_new_episodes())
-        asyncio.create_task(process_download_queue())
-        asyncio.create_task(update_status_message())
         
-        logger.info("All background tasks started")
-        logger.info("Bot is now running. Press Ctrl+C to stop.")
-        
-        # Keep the bot running
-        await idle()
+        # Start background tasks - the group waits for all of them on the way out
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(check_new_episodes(), name="checker"),
+                tg.create_task(airing_dispatcher(), name="airing"),
+                tg.create_task(process_download_queue(), name="downloader"),
+                tg.create_task(process_upload_queue(), name="uploader"),
+                tg.create_task(update_status_message(), name="status")
+            ]
+            
+            logger.info("All background tasks started")
+            logger.info("Bot is now running. Press Ctrl+C to stop.")
+            
+            # Keep the bot running
+            await idle()
+            
+            logger.info("Stopping background tasks...")
+            for task in tasks:
+                task.cancel()
         
     except Exception as e:
         logger.error(f"Fatal error: {e}")
     finally:
         await app.stop()
+        await scheduler.close_session()
+        await downloader.close_session()
         await db.close()
+        if web_runner:
+            await web_runner.cleanup()
         logger.info("Bot stopped")
 
 
@@ -2,14 +2,173 @@
 Anime scheduler - Checks for new episodes using AniList and Consumet APIs
 """
 
+import time
+import heapq
+import asyncio
 import logging
 import aiohttp
-from typing import Dict, List, Optional
-from datetime import datetime
-from config import Config
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+import orjson
+from aiolimiter import AsyncLimiter
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+from config import get_config
 
 logger = logging.getLogger(__name__)
 
+# Fields fetched for every anime info lookup (single and bulk)
+MEDIA_INFO_FRAGMENT = """
+fragment MediaInfo on Media {
+    id
+    title {
+        romaji
+        english
+        native
+    }
+    episodes
+    status
+    coverImage {
+        large
+        medium
+    }
+    bannerImage
+    description
+    season
+    seasonYear
+    genres
+    averageScore
+    nextAiringEpisode {
+        episode
+        airingAt
+    }
+}
+"""
+
+ANIME_INFO_QUERY = """
+query ($id: Int) {
+    Media(id: $id, type: ANIME) {
+        ...MediaInfo
+    }
+}
+""" + MEDIA_INFO_FRAGMENT
+
+SEARCH_ANIME_QUERY = """
+query ($search: String, $perPage: Int) {
+    Page(page: 1, perPage: $perPage) {
+        media(search: $search, type: ANIME, sort: POPULARITY_DESC) {
+            id
+            title {
+                romaji
+                english
+                native
+            }
+            episodes
+            status
+            coverImage {
+                large
+                medium
+            }
+            description
+            season
+            seasonYear
+            genres
+        }
+    }
+}
+"""
+
+AIRING_SCHEDULE_QUERY = """
+query ($airingAt_greater: Int, $airingAt_lesser: Int) {
+    Page(page: 1, perPage: 50) {
+        airingSchedules(
+            airingAt_greater: $airingAt_greater
+            airingAt_lesser: $airingAt_lesser
+            sort: TIME
+        ) {
+            media {
+                id
+                title {
+                    romaji
+                    english
+                }
+                coverImage {
+                    medium
+                }
+            }
+            episode
+            airingAt
+        }
+    }
+}
+"""
+
+# How long AniList responses are reused (seconds)
+SEARCH_CACHE_TTL = 86400
+INFO_CACHE_TTL = 300
+SCHEDULE_CACHE_TTL = 300
+ANILIST_CACHE_SIZE = 1024
+
+# Max anime looked up per bulk AniList request
+BULK_INFO_BATCH_SIZE = 50
+
+
+@lru_cache(maxsize=None)
+def build_bulk_info_query(count: int) -> str:
+    """Build an aliased query fetching `count` anime ($id0..$idN) in one request"""
+    params = ", ".join(f"$id{i}: Int" for i in range(count))
+    aliases = "\n".join(f"    a{i}: Media(id: $id{i}, type: ANIME) {{ ...MediaInfo }}" for i in range(count))
+    return f"query ({params}) {{\n{aliases}\n}}\n{MEDIA_INFO_FRAGMENT}"
+
+
+@dataclass(frozen=True, slots=True)
+class Anime:
+    """An anime as returned by AniList search and info lookups"""
+    id: int
+    title_english: Optional[str]
+    title_romaji: str
+    episodes: int
+    status: str
+    cover_image: str
+    description: str
+    genres: Tuple[str, ...]
+    
+    # Only fetched by info lookups
+    banner_image: Optional[str] = None
+    score: int = 0
+    next_episode: int = 0
+    next_airing: int = 0
+    
+    @property
+    def title(self) -> str:
+        """Display title - English when AniList has one"""
+        return self.title_english or self.title_romaji
+    
+    @classmethod
+    def from_media(cls, media: Dict) -> "Anime":
+        """Convert an AniList Media object"""
+        next_airing = media.get("nextAiringEpisode") or {}
+        return cls(
+            id=media["id"],
+            title_english=media["title"]["english"],
+            title_romaji=media["title"]["romaji"],
+            episodes=media.get("episodes") or 0,
+            status=media["status"],
+            cover_image=media["coverImage"]["large"],
+            description=media.get("description") or "",
+            genres=tuple(media.get("genres") or ()),
+            banner_image=media.get("bannerImage"),
+            score=media.get("averageScore") or 0,
+            next_episode=next_airing.get("episode", 0),
+            next_airing=next_airing.get("airingAt", 0)
+        )
+    
+    def as_dict(self) -> Dict:
+        """Plain dict for storage, including the display title"""
+        data = asdict(self)
+        data["title"] = self.title
+        return data
+
 
 class AnimeScheduler:
     """Handles anime scheduling and episode detection"""
@@ -18,11 +177,37 @@ class AnimeScheduler:
         self.db = database
         self.is_running = False
         self.session: Optional[aiohttp.ClientSession] = None
+        
+        # AniList rate limit (requests per minute)
+        self.anilist_limiter = AsyncLimiter(get_config().ANILIST_RATE_LIMIT, 60)
+        
+        # (query, variables) -> (expires_at, data)
+        self._anilist_cache: Dict[Tuple[str, bytes], Tuple[float, Dict]] = {}
+        
+        # (url, params) -> (etag, data) for conditional Consumet requests
+        self._consumet_etags: Dict[Tuple[str, bytes], Tuple[str, Dict]] = {}
+        
+        # Targeted checks: heap of (due_at, anime_id); _check_due holds the live entry per anime
+        self._check_heap: List[Tuple[float, int]] = []
+        self._check_due: Dict[int, float] = {}
+        self._check_wakeup = asyncio.Event()
     
     async def get_session(self) -> aiohttp.ClientSession:
         """Get or create aiohttp session"""
         if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=100,
+                    limit_per_host=20,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=75,
+                    enable_cleanup_closed=True
+                ),
+                timeout=aiohttp.ClientTimeout(total=30, connect=5),
+                # aiohttp decodes br responses when the Brotli package is installed
+                headers={"Accept-Encoding": "gzip, deflate, br"},
+                json_serialize=lambda obj: orjson.dumps(obj).decode()
+            )
         return self.session
     
     async def close_session(self):
@@ -32,157 +217,136 @@ class AnimeScheduler:
     
     # ==================== AniList API Methods ====================
     
-    async def search_anime(self, query: str, limit: int = 5) -> List[Dict]:
-        """Search for anime using AniList API"""
-        graphql_query = """
-        query ($search: String, $perPage: Int) {
-            Page(page: 1, perPage: $perPage) {
-                media(search: $search, type: ANIME, sort: POPULARITY_DESC) {
-                    id
-                    title {
-                        romaji
-                        english
-                        native
-                    }
-                    episodes
-                    status
-                    coverImage {
-                        large
-                        medium
-                    }
-                    description
-                    season
-                    seasonYear
-                    genres
-                }
-            }
-        }
-        """
+    def _cache_key(self, query: str, variables: Dict) -> Tuple[str, bytes]:
+        """Canonical cache key for an AniList request"""
+        return query, orjson.dumps(variables, option=orjson.OPT_SORT_KEYS)
+    
+    def _cache_store(self, key: Tuple[str, bytes], data: Dict, ttl: int):
+        """Remember a response, evicting expired (then oldest) entries when full"""
+        now = time.monotonic()
+        if len(self._anilist_cache) >= ANILIST_CACHE_SIZE:
+            for stale in [k for k, (expires, _) in self._anilist_cache.items() if expires <= now]:
+                del self._anilist_cache[stale]
+        if len(self._anilist_cache) >= ANILIST_CACHE_SIZE:
+            del self._anilist_cache[next(iter(self._anilist_cache))]
+        self._anilist_cache[key] = (now + ttl, data)
+    
+    def invalidate_anime_info(self, anime_id: int):
+        """Forget cached info for an anime (e.g. when it starts being tracked)"""
+        self._anilist_cache.pop(self._cache_key(ANIME_INFO_QUERY, {"id": anime_id}), None)
+    
+    async def _post_anilist(self, query: str, variables: Dict, ttl: int = 0) -> Optional[Dict]:
+        """Run an AniList GraphQL query within the rate limit, caching for `ttl` seconds"""
+        key = self._cache_key(query, variables) if ttl else None
+        if key:
+            cached = self._anilist_cache.get(key)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
         
+        session = await self.get_session()
+        async with self.anilist_limiter:
+            async with session.post(
+                get_config().ANILIST_API,
+                json={"query": query, "variables": variables}
+            ) as response:
+                if response.status != 200:
+                    logger.error(f"AniList API error: {response.status}")
+                    return None
+                
+                data = orjson.loads(await response.read()).get("data") or {}
+        
+        if key:
+            self._cache_store(key, data, ttl)
+        return data
+    
+    async def search_anime(self, query: str, limit: int = 5) -> List[Anime]:
+        """Search for anime using AniList API"""
         variables = {
             "search": query,
             "perPage": limit
         }
         
         try:
-            session = await self.get_session()
-            async with session.post(
-                Config.ANILIST_API,
-                json={"query": graphql_query, "variables": variables}
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    media_list = data.get("data", {}).get("Page", {}).get("media", [])
-                    
-                    results = []
-                    for media in media_list:
-                        results.append({
-                            "id": media["id"],
-                            "title": media["title"]["english"] or media["title"]["romaji"],
-                            "title_english": media["title"]["english"],
-                            "title_romaji": media["title"]["romaji"],
-                            "episodes": media.get("episodes", 0),
-                            "status": media["status"],
-                            "cover_image": media["coverImage"]["large"],
-                            "description": media.get("description", ""),
-                            "genres": media.get("genres", [])
-                        })
-                    
-                    return results
-                else:
-                    logger.error(f"AniList API error: {response.status}")
-                    return []
-                    
+            data = await self._post_anilist(SEARCH_ANIME_QUERY, variables, ttl=SEARCH_CACHE_TTL)
+            if data is None:
+                return []
+            
+            media_list = data.get("Page", {}).get("media", [])
+            return [Anime.from_media(media) for media in media_list]
+            
         except Exception as e:
             logger.error(f"Error searching anime: {e}")
             return []
     
-    async def get_anime_info(self, anime_id: int) -> Optional[Dict]:
+    async def get_anime_info(self, anime_id: int) -> Optional[Anime]:
         """Get detailed anime information from AniList"""
-        graphql_query = """
-        query ($id: Int) {
-            Media(id: $id, type: ANIME) {
-                id
-                title {
-                    romaji
-                    english
-                    native
-                }
-                episodes
-                status
-                coverImage {
-                    large
-                    medium
-                }
-                bannerImage
-                description
-                season
-                seasonYear
-                genres
-                averageScore
-                nextAiringEpisode {
-                    episode
-                    airingAt
-                }
-            }
-        }
-        """
-        
         variables = {"id": anime_id}
         
         try:
-            session = await self.get_session()
-            async with session.post(
-                Config.ANILIST_API,
-                json={"query": graphql_query, "variables": variables}
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    media = data.get("data", {}).get("Media", {})
-                    
-                    if not media:
-                        return None
-                    
-                    return {
-                        "id": media["id"],
-                        "title": media["title"]["english"] or media["title"]["romaji"],
-                        "title_english": media["title"]["english"],
-                        "title_romaji": media["title"]["romaji"],
-                        "episodes": media.get("episodes", 0),
-                        "status": media["status"],
-                        "cover_image": media["coverImage"]["large"],
-                        "banner_image": media.get("bannerImage"),
-                        "description": media.get("description", ""),
-                        "genres": media.get("genres", []),
-                        "score": media.get("averageScore", 0),
-                        "next_episode": media.get("nextAiringEpisode", {}).get("episode", 0),
-                        "next_airing": media.get("nextAiringEpisode", {}).get("airingAt", 0)
-                    }
-                else:
-                    logger.error(f"AniList API error: {response.status}")
-                    return None
-                    
+            data = await self._post_anilist(ANIME_INFO_QUERY, variables, ttl=INFO_CACHE_TTL)
+            media = (data or {}).get("Media", {})
+            
+            if not media:
+                return None
+            
+            return Anime.from_media(media)
+            
         except Exception as e:
             logger.error(f"Error getting anime info: {e}")
             return None
     
+    async def get_anime_info_bulk(self, anime_ids: List[int]) -> Dict[int, Anime]:
+        """Get anime information for many anime with one request per batch"""
+        results = {}
+        
+        for start in range(0, len(anime_ids), BULK_INFO_BATCH_SIZE):
+            batch = anime_ids[start:start + BULK_INFO_BATCH_SIZE]
+            variables = {f"id{i}": anime_id for i, anime_id in enumerate(batch)}
+            
+            try:
+                data = await self._post_anilist(build_bulk_info_query(len(batch)), variables)
+                if not data:
+                    continue
+                
+                for media in data.values():
+                    if media:
+                        results[media["id"]] = Anime.from_media(media)
+                        
+            except Exception as e:
+                logger.error(f"Error getting bulk anime info: {e}")
+        
+        return results
+    
     # ==================== Consumet API Methods ====================
     
+    async def _get_consumet(self, url: str, params: Optional[Dict] = None) -> Dict:
+        """GET a Consumet endpoint, revalidating with the last ETag it returned"""
+        key = (url, orjson.dumps(params, option=orjson.OPT_SORT_KEYS) if params else b"")
+        cached = self._consumet_etags.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else None
+        
+        session = await self.get_session()
+        async with session.get(url, params=params, headers=headers) as response:
+            if cached and response.status == 304:
+                return cached[1]
+            
+            response.raise_for_status()
+            data = orjson.loads(await response.read())
+            etag = response.headers.get("ETag")
+        
+        if etag:
+            if len(self._consumet_etags) >= ANILIST_CACHE_SIZE:
+                del self._consumet_etags[next(iter(self._consumet_etags))]
+            self._consumet_etags[key] = (etag, data)
+        return data
+    
     async def get_recent_episodes(self, page: int = 1) -> List[Dict]:
         """Get recent episodes from Consumet API"""
         try:
-            session = await self.get_session()
-            url = f"{Config.CONSUMET_API}/meta/anilist/recent-episodes"
-            params = {"page": page, "perPage": 20}
-            
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get("results", [])
-                else:
-                    logger.error(f"Consumet API error: {response.status}")
-                    return []
-                    
+            url = f"{get_config().CONSUMET_API}/meta/anilist/recent-episodes"
+            data = await self._get_consumet(url, {"page": page, "perPage": 20})
+            return data.get("results", [])
+            
         except Exception as e:
             logger.error(f"Error getting recent episodes: {e}")
             return []
@@ -190,26 +354,19 @@ class AnimeScheduler:
     async def get_episode_links(self, episode_id: str) -> Dict:
         """Get download links for an episode from Consumet"""
         try:
-            session = await self.get_session()
-            url = f"{Config.CONSUMET_API}/meta/anilist/watch/{episode_id}"
-            
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    # Extract links by quality
-                    links = {}
-                    for source in data.get("sources", []):
-                        quality = source.get("quality", "unknown")
-                        url = source.get("url", "")
-                        if url:
-                            links[quality] = url
-                    
-                    return links
-                else:
-                    logger.error(f"Consumet API error: {response.status}")
-                    return {}
-                    
+            url = f"{get_config().CONSUMET_API}/meta/anilist/watch/{episode_id}"
+            data = await self._get_consumet(url)
+            
+            # Extract links by quality
+            links = {}
+            for source in data.get("sources", []):
+                quality = source.get("quality", "unknown")
+                url = source.get("url", "")
+                if url:
+                    links[quality] = url
+            
+            return links
+            
         except Exception as e:
             logger.error(f"Error getting episode links: {e}")
             return {}
@@ -217,26 +374,19 @@ class AnimeScheduler:
     async def search_anime_episodes(self, anime_title: str) -> List[Dict]:
         """Search for anime episodes on Consumet"""
         try:
-            session = await self.get_session()
-            url = f"{Config.CONSUMET_API}/meta/anilist/{anime_title}"
-            
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    # Get first result
-                    if data.get("results"):
-                        anime = data["results"][0]
-                        anime_id = anime.get("id")
-                        
-                        # Get episodes for this anime
-                        return await self.get_anime_episodes(anime_id)
-                    
-                    return []
-                else:
-                    logger.error(f"Consumet search error: {response.status}")
-                    return []
-                    
+            url = f"{get_config().CONSUMET_API}/meta/anilist/{anime_title}"
+            data = await self._get_consumet(url)
+            
+            # Get first result
+            if data.get("results"):
+                anime = data["results"][0]
+                anime_id = anime.get("id")
+                
+                # Get episodes for this anime
+                return await self.get_anime_episodes(anime_id)
+            
+            return []
+            
         except Exception as e:
             logger.error(f"Error searching anime episodes: {e}")
             return []
@@ -244,25 +394,72 @@ class AnimeScheduler:
     async def get_anime_episodes(self, anime_id: str) -> List[Dict]:
         """Get all episodes for an anime from Consumet"""
         try:
-            session = await self.get_session()
-            url = f"{Config.CONSUMET_API}/meta/anilist/info/{anime_id}"
-            
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get("episodes", [])
-                else:
-                    logger.error(f"Consumet API error: {response.status}")
-                    return []
-                    
+            url = f"{get_config().CONSUMET_API}/meta/anilist/info/{anime_id}"
+            data = await self._get_consumet(url)
+            return data.get("episodes", [])
+            
         except Exception as e:
             logger.error(f"Error getting anime episodes: {e}")
             return []
     
+    # ==================== Airing-Based Scheduling ====================
+    
+    def schedule_check(self, anime_id: int, when: float):
+        """Schedule a targeted check for an anime at unix time `when` (earliest wins)"""
+        current = self._check_due.get(anime_id)
+        if current is not None and current <= when:
+            return
+        
+        self._check_due[anime_id] = when
+        heapq.heappush(self._check_heap, (when, anime_id))
+        self._check_wakeup.set()
+    
+    def schedule_next_check(self, anime_id: int, anime_info: Anime, latest_episode: int):
+        """Plan the next check from AniList's airing info"""
+        config = get_config()
+        next_episode = anime_info.next_episode
+        next_airing = anime_info.next_airing
+        
+        if next_episode and next_episode - 1 > latest_episode:
+            # An episode has aired but isn't available yet - look again soon
+            self.schedule_check(anime_id, time.time() + config.CHECK_INTERVAL)
+        elif next_airing:
+            # Sources need a few minutes after airing to list the episode
+            self.schedule_check(anime_id, next_airing + config.AIRING_CHECK_DELAY)
+    
+    def schedule_retry(self, anime_id: int):
+        """Check an anime again after CHECK_INTERVAL (e.g. when AniList failed)"""
+        self.schedule_check(anime_id, time.time() + get_config().CHECK_INTERVAL)
+    
+    async def wait_for_due_check(self) -> int:
+        """Sleep until the next scheduled check is due and return its anime ID"""
+        while True:
+            delay = None
+            while self._check_heap:
+                when, anime_id = self._check_heap[0]
+                
+                # Skip entries replaced by an earlier schedule
+                if self._check_due.get(anime_id) != when:
+                    heapq.heappop(self._check_heap)
+                    continue
+                
+                delay = when - time.time()
+                if delay <= 0:
+                    heapq.heappop(self._check_heap)
+                    del self._check_due[anime_id]
+                    return anime_id
+                break
+            
+            self._check_wakeup.clear()
+            try:
+                await asyncio.wait_for(self._check_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+    
     # ==================== Episode Checking Logic ====================
     
-    async def check_anime_updates(self, anime: Dict) -> List[Dict]:
-        """Check for new episodes for a specific anime"""
+    async def check_anime_updates(self, anime: Dict, anime_info: Optional[Anime] = None) -> List[Dict]:
+        """Check for new episodes for a specific anime (pass anime_info if already fetched)"""
         try:
             anime_id = anime["anime_id"]
             anime_title = anime["title"]
@@ -271,93 +468,81 @@ class AnimeScheduler:
             logger.info(f"Checking updates for {anime_title} (latest: Episode {latest_episode})")
             
             # Get anime info from AniList
-            anime_info = await self.get_anime_info(anime_id)
+            if anime_info is None:
+                anime_info = await self.get_anime_info(anime_id)
             
             if not anime_info:
                 logger.warning(f"Could not get info for anime ID {anime_id}")
+                self.schedule_retry(anime_id)
                 return []
             
-            # Check if there's a next airing episode
-            next_episode = anime_info.get("next_episode", 0)
+            # Check if there's a next airing episode - everything before it has aired
+            next_episode = anime_info.next_episode
             
-            if next_episode <= latest_episode:
+            if next_episode - 1 <= latest_episode:
                 logger.info(f"No new episodes for {anime_title}")
+                self.schedule_next_check(anime_id, anime_info, latest_episode)
                 return []
             
             # Search for episodes on Consumet
             episodes = await self.search_anime_episodes(anime_title)
             
+            # Only aired episodes past the latest one are candidates; links are
+            # fetched below just for the ones not already stored
+            candidates = [ep for ep in episodes if latest_episode < ep.get("number", 0) < next_episode]
+            
+            # Look up every candidate episode in one query
+            existing = await self.db.bulk_exists(anime_id, [ep.get("number", 0) for ep in candidates])
+            
+            # One timestamp for everything found in this check
+            now = datetime.now(timezone.utc)
+            
             new_episodes = []
-            for episode in episodes:
+            for episode in candidates:
                 episode_num = episode.get("number", 0)
+                if episode_num in existing:
+                    continue
                 
-                # Check if this is a new episode
-                if episode_num > latest_episode:
-                    # Check if already in database
-                    exists = await self.db.episode_exists(anime_id, episode_num)
-                    
-                    if not exists:
-                        episode_id = episode.get("id", "")
-                        
-                        # Get download links
-                        links = await self.get_episode_links(episode_id)
-                        
-                        episode_data = {
-                            "anime_id": anime_id,
-                            "anime_title": anime_title,
-                            "episode_number": episode_num,
-                            "title": episode.get("title", f"Episode {episode_num}"),
-                            "download_links": links,
-                            "aired_at": datetime.utcnow()
-                        }
-                        
-                        new_episodes.append(episode_data)
-                        
-                        # Add to database
-                        await self.db.add_episode(episode_data)
-                        
-                        logger.info(f"Found new episode: {anime_title} - Episode {episode_num}")
+                episode_id = episode.get("id", "")
+                
+                # Get download links
+                links = await self.get_episode_links(episode_id)
+                
+                episode_data = {
+                    "anime_id": anime_id,
+                    "anime_title": anime_title,
+                    "episode_number": episode_num,
+                    "title": episode.get("title", f"Episode {episode_num}"),
+                    "download_links": links,
+                    "aired_at": now
+                }
+                
+                new_episodes.append(episode_data)
+                logger.info(f"Found new episode: {anime_title} - Episode {episode_num}")
+            
+            # Add to database
+            await self.db.add_episodes_bulk(new_episodes)
             
             # Update anime's latest episode
             if new_episodes:
                 max_episode = max(ep["episode_number"] for ep in new_episodes)
                 await self.db.update_anime_episode(anime_id, max_episode)
+                latest_episode = max(latest_episode, max_episode)
             
+            self.schedule_next_check(anime_id, anime_info, latest_episode)
             return new_episodes
             
         except Exception as e:
             logger.error(f"Error checking anime updates: {e}")
+            if "anime_id" in anime:
+                self.schedule_retry(anime["anime_id"])
             return []
     
     async def get_airing_schedule(self) -> List[Dict]:
         """Get today's airing schedule from AniList"""
-        graphql_query = """
-        query ($airingAt_greater: Int, $airingAt_lesser: Int) {
-            Page(page: 1, perPage: 50) {
-                airingSchedules(
-                    airingAt_greater: $airingAt_greater
-                    airingAt_lesser: $airingAt_lesser
-                    sort: TIME
-                ) {
-                    media {
-                        id
-                        title {
-                            romaji
-                            english
-                        }
-                        coverImage {
-                            medium
-                        }
-                    }
-                    episode
-                    airingAt
-                }
-            }
-        }
-        """
-        
-        # Get current timestamp and end of day
-        now = int(datetime.utcnow().timestamp())
+        # Get current timestamp (rounded so repeated calls share a cache entry) and end of day
+        now = int(datetime.now(timezone.utc).timestamp())
+        now -= now % SCHEDULE_CACHE_TTL
         end_of_day = now + 86400  # 24 hours
         
         variables = {
@@ -366,31 +551,25 @@ class AnimeScheduler:
         }
         
         try:
-            session = await self.get_session()
-            async with session.post(
-                Config.ANILIST_API,
-                json={"query": graphql_query, "variables": variables}
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    schedules = data.get("data", {}).get("Page", {}).get("airingSchedules", [])
-                    
-                    results = []
-                    for schedule in schedules:
-                        media = schedule["media"]
-                        results.append({
-                            "anime_id": media["id"],
-                            "title": media["title"]["english"] or media["title"]["romaji"],
-                            "episode": schedule["episode"],
-                            "airing_at": schedule["airingAt"],
-                            "cover_image": media["coverImage"]["medium"]
-                        })
-                    
-                    return results
-                else:
-                    logger.error(f"AniList API error: {response.status}")
-                    return []
-                    
+            data = await self._post_anilist(AIRING_SCHEDULE_QUERY, variables, ttl=SCHEDULE_CACHE_TTL)
+            if data is None:
+                return []
+            
+            schedules = data.get("Page", {}).get("airingSchedules", [])
+            
+            results = []
+            for schedule in schedules:
+                media = schedule["media"]
+                results.append({
+                    "anime_id": media["id"],
+                    "title": media["title"]["english"] or media["title"]["romaji"],
+                    "episode": schedule["episode"],
+                    "airing_at": schedule["airingAt"],
+                    "cover_image": media["coverImage"]["medium"]
+                })
+            
+            return results
+            
         except Exception as e:
             logger.error(f"Error getting airing schedule: {e}")
             return []
@@ -3,116 +3,200 @@ Telegram uploader - Uploads episodes to Telegram channels
 Generates thumbnails and posts info to index channel
 """
 
+import io
 import os
+import hashlib
 import logging
 import asyncio
+from bisect import bisect_right
+from itertools import accumulate
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+import PIL
 from PIL import Image, ImageDraw, ImageFont
 from pyrogram import Client
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from config import Config
+from config import get_config
+from downloader import drop_page_cache, prefetch_file
 
 logger = logging.getLogger(__name__)
 
+# Thumbnail canvas (width, height)
+THUMB_SIZE = (1280, 720)
+
+# Thumbnail JPEG quality - previews are small, 70 looks the same as 85 at a fraction of the size
+THUMB_JPEG_QUALITY = 70
+
+# Encoded thumbnails kept for retries/reprocessing (~100KB each)
+THUMB_CACHE_SIZE = 32
+
+# Optional libjpeg-turbo encoder - faster than Pillow's save path (pip install simplejpeg)
+try:
+    import numpy
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
 
 class TelegramUploader:
     """Handles uploading episodes to Telegram"""
     
+    # (title, episode, channel) fonts, loaded on first thumbnail
+    _fonts = None
+    
     def __init__(self, client: Client, database):
         self.client = client
         self.db = database
-        self.thumb_dir = Path("thumbnails")
-        self.thumb_dir.mkdir(exist_ok=True)
+        
+        # Pillow-SIMD reports versions like "9.5.0.post1"
+        logger.info(f"Using Pillow {PIL.__version__}")
+        
+        # Background and channel name are the same on every thumbnail
+        self._thumb_template = self._build_thumb_template()
+        
+        # Input hash -> encoded JPEG; thumbnails are deterministic in their inputs
+        self._thumb_cache: Dict[str, bytes] = {}
     
-    def generate_thumbnail(self, anime_title: str, episode_number: int, cover_image_path: Optional[Path] = None) -> Path:
-        """Generate custom thumbnail for episode"""
+    def generate_thumbnail(self, anime_title: str, episode_number: int, cover_image_path: Optional[Path] = None) -> Optional[bytes]:
+        """Generate custom thumbnail for episode as JPEG bytes"""
+        key = hashlib.blake2b(
+            f"{anime_title}|{episode_number}|{get_config().CHANNEL_TITLE}|{cover_image_path}".encode(),
+            digest_size=16
+        ).hexdigest()
+        cached = self._thumb_cache.get(key)
+        if cached:
+            logger.info(f"Reusing thumbnail: {anime_title} E{episode_number}")
+            return cached
+        
         try:
-            # Create image
-            width, height = 1280, 720
-            img = Image.new('RGB', (width, height), color=(20, 20, 30))
+            # Start from the pre-drawn background
+            width, height = THUMB_SIZE
+            img = self._thumb_template.copy()
             draw = ImageDraw.Draw(img)
             
             # Add cover image if provided
+            has_cover = False
             if cover_image_path and cover_image_path.exists():
                 try:
-                    cover = Image.open(cover_image_path)
-                    cover = cover.resize((400, 600))
-                    img.paste(cover, (50, 60))
+                    with Image.open(cover_image_path) as cover:
+                        # Let libjpeg decode at a reduced scale - BILINEAR is enough for the rest
+                        cover.draft('RGB', (400, 600))
+                        img.paste(cover.resize((400, 600), Image.Resampling.BILINEAR), (50, 60))
+                    has_cover = True
                 except Exception as e:
                     logger.error(f"Error adding cover image: {e}")
             
             # Add text
-            try:
-                # Try to use a nice font, fallback to default
-                title_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 60)
-                ep_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 80)
-                channel_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 40)
-            except:
-                title_font = ImageFont.load_default()
-                ep_font = ImageFont.load_default()
-                channel_font = ImageFont.load_default()
+            title_font, ep_font, _ = self._get_fonts()
             
             # Draw title
-            title_lines = self._wrap_text(anime_title, 30)
-            y_offset = 100
-            for line in title_lines[:3]:  # Max 3 lines
-                draw.text((500, y_offset), line, fill=(255, 255, 255), font=title_font)
-                y_offset += 70
+            # Title column runs from x=500 to a 40px right margin
+            title_lines = self._wrap_text(draw, anime_title, title_font, width - 540)
+            # Max 3 lines; Pillow's pitch is the height of "A" (56px at 60px DejaVu Bold)
+            # plus spacing, so 14 keeps the previous 70px pitch
+            draw.multiline_text(
+                (500, 100), "\n".join(title_lines[:3]), fill=(255, 255, 255), font=title_font, spacing=14
+            )
             
             # Draw episode number
             ep_text = f"Episode {episode_number}"
             draw.text((500, height - 200), ep_text, fill=(100, 200, 255), font=ep_font)
             
-            # Draw channel name
-            draw.text((500, height - 100), Config.CHANNEL_TITLE, fill=(150, 150, 150), font=channel_font)
+            # Without a cover it's flat colours and anti-aliased text - 64 colours look identical
+            # and leave the encoder less noise to spend bytes on
+            if not has_cover:
+                img = img.quantize(colors=64, method=Image.Quantize.FASTOCTREE).convert('RGB')
+            
+            # Encode in memory - pyrogram uploads the thumbnail straight from a buffer
+            thumb = self._encode_jpeg(img)
             
-            # Save thumbnail
-            thumb_path = self.thumb_dir / f"thumb_{anime_title.replace(' ', '_')}_E{episode_number}.jpg"
-            img.save(thumb_path, "JPEG", quality=85)
+            logger.info(f"Generated thumbnail: {anime_title} E{episode_number} ({len(thumb) // 1024} KB)")
             
-            logger.info(f"Generated thumbnail: {thumb_path.name}")
-            return thumb_path
+            if len(self._thumb_cache) >= THUMB_CACHE_SIZE:
+                del self._thumb_cache[next(iter(self._thumb_cache))]
+            self._thumb_cache[key] = thumb
+            return thumb
             
         except Exception as e:
             logger.error(f"Error generating thumbnail: {e}")
             # Return None to upload without thumbnail
             return None
     
-    def _wrap_text(self, text: str, max_chars: int) -> List[str]:
-        """Wrap text into lines"""
+    def _build_thumb_template(self) -> Image.Image:
+        """Draw the parts shared by every thumbnail"""
+        width, height = THUMB_SIZE
+        img = Image.new('RGB', (width, height), color=(20, 20, 30))
+        draw = ImageDraw.Draw(img)
+        
+        # Draw channel name
+        channel_font = self._get_fonts()[2]
+        draw.text((500, height - 100), get_config().CHANNEL_TITLE, fill=(150, 150, 150), font=channel_font)
+        return img
+    
+    def _encode_jpeg(self, img: Image.Image) -> bytes:
+        """Encode an RGB image as JPEG, with simplejpeg when installed"""
+        if simplejpeg:
+            # simplejpeg has no progressive/optimize options - only Pillow's path uses them
+            return simplejpeg.encode_jpeg(numpy.asarray(img), quality=THUMB_JPEG_QUALITY, colorspace='RGB')
+        
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=THUMB_JPEG_QUALITY, optimize=True, progressive=True)
+        return buffer.getvalue()
+    
+    @classmethod
+    def _get_fonts(cls):
+        """Load thumbnail fonts once per process"""
+        if cls._fonts is None:
+            try:
+                # Try to use a nice font, fallback to default
+                cls._fonts = (
+                    ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 60),
+                    ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 80),
+                    ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 40)
+                )
+            except OSError:
+                default_font = ImageFont.load_default()
+                cls._fonts = (default_font, default_font, default_font)
+        return cls._fonts
+    
+    def _wrap_text(self, draw: ImageDraw.ImageDraw, text: str, font, max_width: float) -> List[str]:
+        """Wrap text into lines no wider than max_width pixels"""
         words = text.split()
-        lines = []
-        current_line = []
-        current_length = 0
+        if not words:
+            return []
         
-        for word in words:
-            if current_length + len(word) + 1 <= max_chars:
-                current_line.append(word)
-                current_length += len(word) + 1
-            else:
-                if current_line:
-                    lines.append(' '.join(current_line))
-                current_line = [word]
-                current_length = len(word)
+        # Right edge of each word (plus its trailing space) measured from the first word
+        space_width = draw.textlength(" ", font=font)
+        edges = list(accumulate(draw.textlength(word + " ", font=font) for word in words))
         
-        if current_line:
-            lines.append(' '.join(current_line))
+        lines = []
+        start = 0
+        line_offset = 0.0
+        while start < len(words):
+            # Greedy break - take every word whose edge, minus its trailing space, still fits
+            end = bisect_right(edges, line_offset + max_width + space_width, lo=start)
+            end = max(end, start + 1)  # an overlong word gets a line of its own
+            
+            lines.append(' '.join(words[start:end]))
+            line_offset = edges[end - 1]
+            start = end
         
         return lines
     
-    async def upload_to_channel(self, file_path: Path, quality: str, caption: str, thumb_path: Optional[Path] = None) -> Optional[int]:
+    async def upload_to_channel(self, file_path: Path, quality: str, caption: str, thumb: Optional[bytes] = None) -> Optional[int]:
         """Upload a single file to uploads channel"""
         try:
             logger.info(f"Uploading {quality}: {file_path.name}")
             
             message = await self.client.send_video(
-                chat_id=Config.UPLOADS_CHANNEL_ID,
+                chat_id=get_config().UPLOADS_CHANNEL_ID,
                 video=str(file_path),
                 caption=caption,
-                thumb=str(thumb_path) if thumb_path else None,
+                thumb=self._thumb_file(thumb) if thumb else None,
                 supports_streaming=True,
-                progress=self._upload_progress
+                progress=self._upload_progress,
+                # Last logged decile for this upload
+                progress_args=(quality, [0])
             )
             
             logger.info(f"Uploaded {quality}: Message ID {message.id}")
@@ -122,35 +206,42 @@ class TelegramUploader:
             logger.error(f"Upload error for {quality}: {e}")
             return None
     
-    async def _upload_progress(self, current: int, total: int):
-        """Upload progress callback"""
+    def _thumb_file(self, thumb: bytes) -> io.BytesIO:
+        """Wrap thumbnail bytes in a named file object (one per upload, they're read concurrently)"""
+        thumb_file = io.BytesIO(thumb)
+        thumb_file.name = "thumb.jpg"
+        return thumb_file
+    
+    async def _upload_progress(self, current: int, total: int, quality: str, last_decile: List[int]):
+        """Upload progress callback - logs each 10% step once"""
         if total > 0:
-            progress = (current / total) * 100
-            if int(progress) % 10 == 0:  # Log every 10%
-                logger.info(f"Upload progress: {progress:.1f}%")
+            decile = current * 10 // total
+            if decile > last_decile[0]:
+                last_decile[0] = decile
+                logger.info(f"Upload progress {quality}: {decile * 10}%")
     
     async def post_to_index_channel(self, episode_data: Dict, file_links: Dict[str, str]) -> Optional[int]:
         """Post episode info and links to index channel"""
         try:
             anime_title = episode_data["anime_title"]
             episode_number = episode_data["episode_number"]
+            config = get_config()
             
             # Build caption
-            caption = f"**{anime_title}**\n\n"
-            caption += f"📺 Episode {episode_number}\n\n"
-            caption += f"**Download Links:**\n"
-            
-            for quality, link in file_links.items():
-                caption += f"[{quality.upper()}]({link}) | "
-            
-            caption = caption.rstrip(" | ")
-            caption += f"\n\n💬 {Config.COMMENTS_GROUP_LINK}"
-            caption += f"\n📢 {Config.INDEX_CHANNEL_USERNAME}"
-            caption += f"\n\n#{anime_title.replace(' ', '')}"
+            links = " | ".join(f"[{quality.upper()}]({link})" for quality, link in file_links.items())
+            caption = (
+                f"**{anime_title}**\n\n"
+                f"📺 Episode {episode_number}\n\n"
+                f"**Download Links:**\n"
+                f"{links}"
+                f"\n\n💬 {config.COMMENTS_GROUP_LINK}"
+                f"\n📢 {config.INDEX_CHANNEL_USERNAME}"
+                f"\n\n#{anime_title.replace(' ', '')}"
+            )
             
             # Create voting buttons
             buttons = None
-            if Config.ENABLE_VOTING:
+            if config.ENABLE_VOTING:
                 buttons = InlineKeyboardMarkup([
                     [
                         InlineKeyboardButton("👍 Great", callback_data=f"vote_up_{episode_data['anime_id']}_{episode_number}"),
@@ -160,7 +251,7 @@ class TelegramUploader:
             
             # Send to index channel
             message = await self.client.send_message(
-                chat_id=Config.INDEX_CHANNEL_ID,
+                chat_id=config.INDEX_CHANNEL_ID,
                 text=caption,
                 reply_markup=buttons,
                 disable_web_page_preview=False
@@ -173,60 +264,91 @@ class TelegramUploader:
             logger.error(f"Error posting to index channel: {e}")
             return None
     
-    async def upload_episode(self, episode_data: Dict, downloaded_files: Dict[str, Path]):
-        """Upload all files for an episode"""
+    async def _upload_quality(self, semaphore: asyncio.Semaphore, anime_title: str, episode_number: int, quality: str, file_path: Path, file_size: int, thumb: Optional[bytes]) -> Optional[int]:
+        """Upload one quality of an episode"""
+        # Build caption (the downloader reports the size; stat only if it didn't)
+        file_size = file_size or file_path.stat().st_size
+        size_mb = file_size / (1024 * 1024)
+        
+        caption = (
+            f"**{anime_title}**\n"
+            f"Episode {episode_number} - {quality.upper()}\n"
+            f"Size: {size_mb:.1f} MB\n\n"
+            f"#{anime_title.replace(' ', '')}"
+        )
+        
+        async with semaphore:
+            # Warm the start of the file so the first chunk reads hit page cache
+            await asyncio.to_thread(prefetch_file, file_path)
+            
+            # Upload to channel
+            message_id = await self.upload_to_channel(file_path, quality, caption, thumb)
+            
+            # Kept files won't be read again soon - don't let them evict hotter pages
+            if not get_config().DELETE_AFTER_UPLOAD:
+                drop_page_cache(file_path)
+            
+            # Sleep to avoid flood limits
+            await asyncio.sleep(get_config().UPLOAD_SLEEP_TIME)
+        
+        return message_id
+    
+    def _delete_file(self, file_path: Path):
+        """Delete an uploaded file"""
+        try:
+            file_path.unlink()
+            logger.info(f"Deleted: {file_path.name}")
+        except FileNotFoundError:
+            pass
+    
+    async def upload_episode(self, episode_data: Dict, downloaded_files: Dict[str, Tuple[Path, int]]):
+        """Upload all files for an episode (quality -> (path, size) from the downloader)"""
         try:
             anime_title = episode_data["anime_title"]
             episode_number = episode_data["episode_number"]
             
+            config = get_config()
+            
             logger.info(f"Starting upload: {anime_title} - Episode {episode_number}")
             
             # Generate thumbnail
-            thumb_path = None
-            if Config.ENABLE_THUMBNAILS:
-                thumb_path = self.generate_thumbnail(anime_title, episode_number)
+            thumb = None
+            if config.ENABLE_THUMBNAILS:
+                # Pillow releases the GIL while decoding/encoding - keep it off the event loop
+                thumb = await asyncio.to_thread(self.generate_thumbnail, anime_title, episode_number)
             
-            # Upload each quality
-            file_links = {}
+            # Upload qualities concurrently, UPLOAD_CONCURRENCY at a time
+            semaphore = asyncio.Semaphore(config.UPLOAD_CONCURRENCY)
+            results = await asyncio.gather(
+                *(
+                    self._upload_quality(semaphore, anime_title, episode_number, quality, file_path, file_size, thumb)
+                    for quality, (file_path, file_size) in downloaded_files.items()
+                ),
+                return_exceptions=True
+            )
             
-            for quality, file_path in downloaded_files.items():
-                # Build caption
-                file_size = file_path.stat().st_size
-                size_mb = file_size / (1024 * 1024)
-                
-                caption = f"**{anime_title}**\n"
-                caption += f"Episode {episode_number} - {quality.upper()}\n"
-                caption += f"Size: {size_mb:.1f} MB\n\n"
-                caption += f"#{anime_title.replace(' ', '')}"
-                
-                # Upload to channel
-                message_id = await self.upload_to_channel(file_path, quality, caption, thumb_path)
-                
-                if message_id:
+            file_links = {}
+            for quality, message_id in zip(downloaded_files, results):
+                if isinstance(message_id, Exception):
+                    logger.error(f"Upload error for {quality}: {message_id}")
+                elif message_id:
                     # Create link to message
-                    link = f"https://t.me/{Config.UPLOADS_CHANNEL_USERNAME}/{message_id}"
+                    link = f"https://t.me/{config.UPLOADS_CHANNEL_USERNAME}/{message_id}"
                     file_links[quality] = link
-                    
-                    # Increment upload counter
-                    await self.db.increment_stat("total_uploads")
-                
-                # Sleep to avoid flood limits
-                await asyncio.sleep(Config.UPLOAD_SLEEP_TIME)
+            
+            # Increment upload counter once for the whole episode
+            if file_links:
+                await self.db.increment_stat("total_uploads", len(file_links))
             
             # Post to index channel
             if file_links:
                 await self.post_to_index_channel(episode_data, file_links)
             
-            # Cleanup thumbnail
-            if thumb_path and thumb_path.exists():
-                thumb_path.unlink()
-            
-            # Cleanup downloaded files if configured
-            if Config.DELETE_AFTER_UPLOAD:
-                for file_path in downloaded_files.values():
-                    if file_path.exists():
-                        file_path.unlink()
-                        logger.info(f"Deleted: {file_path.name}")
+            # Cleanup downloaded files if configured (unlinking GB-sized files can block)
+            if config.DELETE_AFTER_UPLOAD:
+                await asyncio.gather(
+                    *(asyncio.to_thread(self._delete_file, file_path) for file_path, _ in downloaded_files.values())
+                )
             
             logger.info(f"Upload completed: {anime_title} E{episode_number}")
             